@@ -1,5 +1,14 @@
 import random
 import math
+import time
+import copy
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+import vectorized
+import patterns
+from geometry import get_geometry
+from bitboard import BitboardState
 
 
 BOT_NAME = "INSERT NAME FOR YOUR BOT HERE"
@@ -9,6 +18,64 @@ class Node:
         self.depth = depth
 
 
+class SearchTimeout(Exception):
+    """Raised inside a search when its time budget has run out."""
+
+
+_worker_agent = None  # each pool worker process's own copy of the agent, see MinimaxAgent
+
+
+def _init_worker(agent):
+    global _worker_agent
+    _worker_agent = agent
+
+
+def _search_state(state, depth, time_left):
+    """Find the minimax value of one state in a worker process.
+
+    Returns: (value, number of states the search generated in this process, how much the
+        search added to the hits, misses and collisions of the process's transposition table)
+    """
+    tt = _worker_agent.tt
+    start = type(state).state_count
+    tt_start = (0, 0, 0) if tt is None else (tt.hits, tt.misses, tt.collisions)
+    _worker_agent.deadline = None if time_left is None else time.perf_counter() + time_left
+    util = _worker_agent.minimax(state, depth)
+    tt_end = (0, 0, 0) if tt is None else (tt.hits, tt.misses, tt.collisions)
+    return (util, type(state).state_count - start,
+            tuple(end - begin for begin, end in zip(tt_start, tt_end)))
+
+
+def rollout(state, rng, heuristic=False, epsilon=0.1):
+    """Play a game out from a state and return its final score.
+
+    Random rollouts play uniformly random moves on a BitboardState copy, which is much cheaper
+    than creating GameStates.  Heuristic rollouts instead play the move whose successor
+    HeuristicAgent.evaluation() likes best for the player moving, or a random one with
+    probability epsilon.
+    """
+    if not heuristic:
+        bb = BitboardState.from_state(state)
+        while not bb.is_full():
+            bb.play(rng.choice(bb.legal_moves()))
+        return bb.score()
+    evaluate = HeuristicAgent().evaluation
+    while not state.is_full():
+        move_states = state.successors()
+        if rng.random() < epsilon:
+            state = rng.choice(move_states)[1]
+        else:
+            sign = state.next_player()
+            state = max((s for _, s in move_states), key=lambda s: sign * evaluate(s))
+    return state.score()
+
+
+def _rollout_batch(states, heuristic, epsilon, seed):
+    """Roll out several states in a worker process; returns their final scores."""
+    rng = random.Random(seed)
+    return [ rollout(state, rng, heuristic, epsilon) for state in states ]
+
+
 class RandomAgent:
     """Agent that picks a random available move.  You should be able to beat it."""
     def get_move(self, state, depth=None):
@@ -29,22 +96,175 @@ class HumanAgent:
         return move, move__state[move]
 
 
+def flip_move(move, flipped, state):
+    """Mirror a move (column) left to right if flipped is true; None stays None."""
+    if flipped and move is not None:
+        return state.num_cols - 1 - move
+    return move
+
+
 class MinimaxAgent:
     """Artificially intelligent agent that uses minimax to optimally select the best move."""
 
+    def __init__(self, tt=None, workers=None, split_ply=1, book=None, symmetry=False,
+                 bounds=False):
+        """Constructor for a minimax agent.
+
+        Args:
+            tt: optional transposition.TranspositionTable used to remember searched positions
+            workers: if given, search the root's subtrees in parallel in this many processes
+            split_ply: how many plies below the root to expand before handing the remaining
+                subtrees to the workers (1 sends each root move as one job)
+            book: optional book.BookReader of solved positions, consulted before searching
+            symmetry: if True, treat each board and its mirror image as the same position: they
+                share transposition table entries, and only half the moves of a symmetric board
+                are searched (the rest are mirror images of them)
+            bounds: if True, exact searches skip subtrees that can't change the result, using the
+                lowest and highest final scores still reachable (see GameState.score_bounds())
+        """
+        self.tt = tt
+        self.book = book
+        self.symmetry = symmetry
+        self.bounds = bounds
+        self.workers = workers
+        self.split_ply = split_ply
+        self.deadline = None  # time.perf_counter() value at which the current search must stop
+        self.root_value = None  # minimax value of the move chosen by the last search_root()
+        self.search_stats = None  # optional profiling.SearchStats, filled in by PruneAgent
+        self._pool = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pool'] = None  # process pools can't be sent to other processes
+        return state
+
+    def close(self):
+        """Shut down the worker processes, if any were started."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def use_symmetry(self, depth):
+        """Whether mirror images can share results in a search to the given depth."""
+        return self.symmetry
+
+    def tt_key(self, state, depth):
+        """Return a state's transposition table key, and whether moves stored under it are
+        mirrored (see GameState.canonical_hash())."""
+        if self.use_symmetry(depth):
+            return state.canonical_hash()
+        return state.zobrist_hash(), False
+
+    def search_moves(self, state, depth):
+        """Return the moves to search from a state, in the order of successors().
+
+        With symmetry on, a symmetric board only gets the moves in the left half of the board,
+        since the others lead to mirror images of those.
+        """
+        moves = state.legal_moves()
+        if self.use_symmetry(depth) and state.is_symmetric():
+            half = (state.num_cols + 1) // 2
+            return [ col for col in moves if col < half ]
+        return moves
+
+    def search_successors(self, state, depth):
+        """Generate the (move, state) pairs to search from a state (see search_moves()).
+
+        The successor states are created lazily, as the search reaches them.
+        """
+        return state.lazy_successors(self.search_moves(state, depth))
+
+    def out_of_reach(self, state, nextp, best_util):
+        """Whether no way of finishing the game from a state can beat best_util for nextp, the
+        player choosing between it and its siblings (only checked with bounds on)."""
+        lower, upper = state.score_bounds()
+        return upper <= best_util if nextp == 1 else lower >= best_util
+
     def get_move(self, state, depth=None):
         """Select the best available move, based on minimax value."""
+        if self.tt is not None:
+            self.tt.new_search()
+        return self.search_root(state, depth)
+
+    def search_root(self, state, depth, first_move=None):
+        """Search every move from the given state and return the best (move, state) pair.
+
+        Args:
+            state: the current board
+            depth: depth limit passed on to minimax() for each successor
+            first_move: a move to search before the others, if the agent reorders moves
+        """
         nextp = state.next_player()
         best_util = -math.inf if nextp == 1 else math.inf
         best_move = None
         best_state = None
 
-        for move, state in state.successors():
-            util = self.minimax(state, depth)
+        move_states = list(self.search_successors(state, depth))
+        if self.workers:
+            utils = self.parallel_minimax([s for _, s in move_states], depth)
+        else:
+            utils = (self.minimax(s, depth) for _, s in move_states)
+
+        for (move, state), util in zip(move_states, utils):
             if ((nextp == 1) and (util > best_util)) or ((nextp == -1) and (util < best_util)):
                 best_util, best_move, best_state = util, move, state
+        self.root_value = best_util
         return best_move, best_state
 
+    def parallel_minimax(self, states, depth):
+        """Find the minimax values of several states using the worker processes.
+
+        The states are expanded split_ply - 1 more plies here, every subtree below that is searched
+        by a worker, and the results are backed up with minimax.  The values are the same as
+        calling minimax() on each state, and the states generated by the workers are added to
+        GameState.state_count so the bookkeeping still adds up.  Each worker has a
+        transposition table of its own, whose counters are added to self.tt's.
+
+        Returns: a list of values, one per state
+        """
+        if self._pool is None:
+            worker = copy.copy(self)
+            worker.workers = None
+            if self.tt is not None:
+                worker.tt = TranspositionTable(self.tt.size)
+            self._pool = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                             initargs=(worker,))
+
+        jobs = []  # (state, depth) for each subtree sent to the workers
+
+        def expand(state, depth, plies):
+            if plies == 0 or depth == 0 or state.is_full():
+                jobs.append((state, depth))
+                return len(jobs) - 1
+            child_depth = None if depth is None else depth - 1
+            return (state.next_player(),
+                    [ expand(child, child_depth, plies - 1)
+                      for _, child in self.search_successors(state, depth) ])
+
+        trees = [expand(state, depth, self.split_ply - 1) for state in states]
+
+        time_left = None
+        if self.deadline is not None:
+            time_left = self.deadline - time.perf_counter()
+        results = list(self._pool.map(_search_state, [s for s, _ in jobs], [d for _, d in jobs],
+                                      [time_left] * len(jobs)))
+        for state, (_, count, tt_counts) in zip(jobs, results):
+            type(state[0]).state_count += count
+            if self.tt is not None:
+                hits, misses, collisions = tt_counts
+                self.tt.hits += hits
+                self.tt.misses += misses
+                self.tt.collisions += collisions
+
+        def back_up(tree):
+            if isinstance(tree, int):
+                return results[tree][0]
+            player, children = tree
+            utils = [back_up(child) for child in children]
+            return max(utils) if player == 1 else min(utils)
+
+        return [back_up(tree) for tree in trees]
+
     def minimax(self, state, depth):
         """Determine the minimax utility value of the given state.
 
@@ -69,20 +289,248 @@ class MinimaxAgent:
             best_util = state.score()
             return best_util
 
-        for move, state in state.successors():
-            # print(move, state)
-            util = self.minimax(state, None)
-            if nextp == 1:
-                best_util = max(best_util, util)
-            elif nextp == -1:
-                best_util = min(best_util, util)
+        if self.book is not None:
+            solved = self.book.lookup(state)
+            if solved is not None:
+                return solved
+
+        if self.bounds:
+            lower, upper = state.score_bounds()
+            if lower == upper:  # every way of finishing the game ends with the same score
+                return lower
+            best_possible = upper if nextp == 1 else lower
+
+        if self.tt is not None:
+            key, flipped = self.tt_key(state, None)
+            entry = self.tt.probe(key, None)
+            if entry is not None and entry.bound == EXACT:
+                return entry.value
+
+        best_move = None
+        for move, child in self.search_successors(state, None):
+            # print(move, child)
+            if self.bounds and best_move is not None and self.out_of_reach(child, nextp, best_util):
+                continue
+            util = self.minimax(child, None)
+            if ((nextp == 1) and (util > best_util)) or ((nextp == -1) and (util < best_util)):
+                best_util, best_move = util, move
+                if self.bounds and best_util == best_possible:
+                    break  # no other move can do better
         # print(best_util)
+
+        if self.tt is not None:
+            self.tt.store(key, best_util, None, EXACT, flip_move(best_move, flipped, state))
         return best_util
 
 
 class HeuristicAgent(MinimaxAgent):
     """Artificially intelligent agent that uses depth-limited minimax to select the best move."""
 
+    def __init__(self, tt=None, time_ms=None, workers=None, split_ply=1, batch_eval=False,
+                 book=None, symmetry=False, bounds=False, ponder=False, use_patterns=False,
+                 weights=None, streak_weights=None):
+        """Constructor for a depth-limited agent.
+
+        Args:
+            tt: optional transposition.TranspositionTable used to remember searched positions
+            time_ms: if given, choose moves by iterative deepening within this many milliseconds
+                per move, instead of searching to a fixed depth
+            workers, split_ply, book, symmetry, bounds: see MinimaxAgent
+            batch_eval: if True, evaluate all the children of a node one ply above the depth
+                limit as a single NumPy batch (see leaf_values(); requires NumPy)
+            ponder: if True, keep searching in a background thread while the opponent chooses
+                its move, and reuse what was found (see start_pondering()); can't be combined
+                with workers
+            use_patterns: if True, evaluate positions with a patterns.PatternEvaluator, updated
+                move by move, instead of rescanning the board (see evaluation())
+            weights: the pattern evaluation's weights, in patterns.WEIGHT_NAMES order (default:
+                patterns.DEFAULT_WEIGHTS); see patterns.load_weights() for reading tuned ones
+            streak_weights: the weights of the evaluation without patterns, in
+                patterns.STREAK_WEIGHT_NAMES order (default: patterns.DEFAULT_STREAK_WEIGHTS)
+        """
+        super().__init__(tt, workers=workers, split_ply=split_ply, book=book, symmetry=symmetry,
+                         bounds=bounds)
+        self.time_ms = time_ms
+        if batch_eval and vectorized.np is None:
+            raise ImportError("vectorized evaluation requires NumPy")
+        self.batch_eval = batch_eval
+        if ponder and workers:
+            raise ValueError("pondering can't be combined with worker processes")
+        self.ponder = ponder
+        self.use_patterns = use_patterns
+        self.weights = patterns.DEFAULT_WEIGHTS if weights is None else tuple(weights)
+        self.streak_weights = (patterns.DEFAULT_STREAK_WEIGHTS if streak_weights is None
+                               else tuple(streak_weights))
+        if use_patterns:
+            self.symmetric_evaluation = True  # see pattern_table()
+        self.pondered = {}  # Zobrist hash -> (move, state, value, depth) found while pondering
+        self.ponder_hits = 0  # moves that reused a pondering result
+        self.ponder_moves = 0  # moves made after pondering
+        self.completed_depth = None  # deepest search finished by the last timed get_move()
+        self._ponder_thread = None
+
+    def close(self):
+        """Stop pondering and shut down the worker processes, if any were started."""
+        self.stop_pondering()
+        super().close()
+
+    def get_move(self, state, depth=None):
+        """Select the best available move.
+
+        With a time budget, the search is repeated with depth limits 0, 1, 2, ... until time runs
+        out (or depth, if given, is reached), and the move from the last completed depth is used.
+        The best move of each depth is searched first at the next one.
+
+        With pondering on, a position already searched while the opponent was thinking isn't
+        searched again: a fixed-depth search returns the pondered move at once, and a timed one
+        carries on deepening from the deepest pondered depth.
+        """
+        pondered = self.stop_pondering(state, depth)
+        if self.use_patterns:
+            # compute the root's value now, so that every state searched from it inherits it
+            state.pattern_value(self.pattern_evaluator(state))
+        if self.time_ms is not None:
+            best = self.deepen(state, depth, pondered)
+        elif pondered is not None:
+            best = pondered[:2]
+            self.root_value = pondered[2]
+        else:
+            best = super().get_move(state, depth)
+        if self.ponder:
+            self.start_pondering(best[1], depth)
+        return best
+
+    def max_depth(self, state, depth):
+        """Return the deepest depth limit worth searching a state to: depth, if given, but no
+        deeper than the last move before the board is full."""
+        empty = sum(1 for c in range(state.num_cols) for r in range(state.num_rows)
+                    if state.get_cell(r, c) == 0)
+        return empty - 1 if depth is None else min(depth, empty - 1)
+
+    def deepen(self, state, depth, pondered=None):
+        """Choose a move by iterative deepening within the time budget (see get_move()).
+
+        Args:
+            state: the current board
+            depth: depth limit to stop deepening at, or None
+            pondered: a (move, state, value, depth) pondering result to continue from, if any
+        """
+        if self.tt is not None:
+            self.tt.new_search()
+        max_depth = self.max_depth(state, depth)
+        deadline = time.perf_counter() + self.time_ms / 1000
+
+        if pondered is not None:
+            best = pondered[:2]
+            self.root_value, self.completed_depth = pondered[2:]
+        else:
+            best = self.search_root(state, 0)  # always finish at least the shallowest search
+            self.completed_depth = 0
+        try:
+            self.deadline = deadline
+            for d in range(self.completed_depth + 1, max_depth + 1):
+                best = self.search_root(state, d, best[0])
+                self.completed_depth = d
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+        return best
+
+    def start_pondering(self, state, depth):
+        """Start searching the opponent's possible replies in a background thread.
+
+        The replies are searched in order of how likely they look: the reply the last search
+        expected (the transposition table's best move for the state) first, then the others from
+        the center out.  Each reply's position is searched the way get_move() would search it:
+        one after the other to the fixed depth, or, with a time budget, all of them deepened
+        together one depth at a time.  Besides the results kept in self.pondered, the searches
+        leave their entries in the transposition table for the next get_move(), which can make
+        it break ties between equally valued moves differently than it would have.  The states the
+        thread generates add to GameState.state_count while the opponent is moving, and being a
+        thread it shares the interpreter with the opponent, so pondering is meant for games
+        against people or programs in other processes.
+
+        Args:
+            state: the state the opponent is choosing a move from
+            depth: the depth limit the next get_move() will be given
+        """
+        if state.is_full():
+            return
+        self.deadline = None
+        self._ponder_thread = threading.Thread(target=self.ponder_replies, args=(state, depth),
+                                               daemon=True)
+        self._ponder_thread.start()
+
+    def stop_pondering(self, state=None, depth=None):
+        """Stop the pondering thread, if it is running, and return what it found for a state.
+
+        Returns: (move, successor state, value, depth searched) for the state, or None if the
+            state wasn't pondered on (to the same depth, for a fixed-depth search)
+        """
+        if self._ponder_thread is None:
+            return None
+        self.deadline = 0.0  # makes the pondering search's next check_time() abort it
+        self._ponder_thread.join()
+        self._ponder_thread = None
+        self.deadline = None
+        pondered, self.pondered = self.pondered, {}
+        if state is None:
+            return None
+
+        self.ponder_moves += 1
+        result = pondered.get(state.zobrist_hash())
+        if result is None or (self.time_ms is None and result[3] != depth):
+            return None
+        self.ponder_hits += 1
+        return result
+
+    def ponder_replies(self, state, depth):
+        """Body of the pondering thread: search the positions after each reply until stopped."""
+        if self.tt is not None:
+            self.tt.new_search()
+            key, flipped = self.tt_key(state, depth)
+            expected = flip_move(self.tt.best_move(key), flipped, state)
+        else:
+            expected = None
+        center = (state.num_cols - 1) / 2
+        replies = sorted(state.legal_moves(),
+                         key=lambda move: (move != expected, abs(move - center), move))
+        positions = [ (child.zobrist_hash(), child) for _, child in state.lazy_successors(replies)
+                      if not child.is_full() ]
+        try:
+            if self.time_ms is None:
+                for key, position in positions:
+                    move, child = self.search_root(position, depth)
+                    self.pondered[key] = (move, child, self.root_value, depth)
+                return
+            for d in range(self.max_depth(state, depth) + 1):
+                for key, position in positions:
+                    if d > self.max_depth(position, depth):
+                        continue
+                    previous = self.pondered.get(key)
+                    move, child = self.search_root(position, d, previous and previous[0])
+                    self.pondered[key] = (move, child, self.root_value, d)
+        except SearchTimeout:
+            pass
+
+    def ponder_stats(self):
+        """Summarize how often pondering paid off as a string."""
+        return "reused on {} of {} moves".format(self.ponder_hits, self.ponder_moves)
+
+    # evaluation() only looks to the right of each streak, so a board and its mirror image can
+    # get different estimates (pattern evaluation, set per agent, doesn't have this problem)
+    symmetric_evaluation = False
+
+    def use_symmetry(self, depth):
+        """Mirror images only share results if the search is exact or evaluation() is symmetric."""
+        return self.symmetry and (depth is None or self.symmetric_evaluation)
+
+    def check_time(self):
+        """Abort the current search if its time budget has run out."""
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
     def minimax(self, state, depth):
         return self.minimax_depth(state, depth)
 
@@ -115,22 +563,79 @@ class HeuristicAgent(MinimaxAgent):
             best_util = self.evaluation(state)
             return best_util
 
-        for move, state in state.successors():
-            if depth is None:
-                depth = None
-                util = self.minimax(state, depth)
-            else:
-                util = self.minimax(state, depth-1)
+        self.check_time()
+        if self.book is not None:
+            solved = self.book.lookup(state)
+            if solved is not None:
+                return solved
 
-            if nextp == 1:
-                best_util = max(best_util, util)
-            elif nextp == -1:
-                best_util = min(best_util, util)
+        # score bounds only apply to exact values, not to evaluation() estimates
+        bounded = self.bounds and depth is None
+        if bounded:
+            lower, upper = state.score_bounds()
+            if lower == upper:
+                return lower
+            best_possible = upper if nextp == 1 else lower
+
+        if self.tt is not None:
+            key, flipped = self.tt_key(state, depth)
+            entry = self.tt.probe(key, depth)
+            if entry is not None and entry.bound == EXACT:
+                return entry.value
+
+        best_move = None
+        if bounded:
+            # best_move and best_util are read as the loop below updates them
+            move_utils = ( (move, self.minimax(child, None))
+                           for move, child in self.search_successors(state, None)
+                           if best_move is None or not self.out_of_reach(child, nextp, best_util) )
+        elif depth == 1 and self.batch_eval:
+            move_states = list(self.search_successors(state, depth))
+            move_utils = zip([m for m, _ in move_states],
+                             self.leaf_values([s for _, s in move_states]))
+        else:
+            child_depth = None if depth is None else depth - 1
+            move_utils = ( (move, self.minimax(child, child_depth))
+                           for move, child in self.search_successors(state, depth) )
+
+        for move, util in move_utils:
+            if ((nextp == 1) and (util > best_util)) or ((nextp == -1) and (util < best_util)):
+                best_util, best_move = util, move
+                if bounded and best_util == best_possible:
+                    break
 
         # depth should only be decremented after all children are explored for a given state
 
+        if self.tt is not None:
+            self.tt.store(key, best_util, depth, EXACT, flip_move(best_move, flipped, state))
         return best_util
 
+    def leaf_values(self, states):
+        """Find the values of several states at the depth limit in one go.
+
+        Gives the same values as calling minimax(state, 0) on each: the score of a full board,
+        otherwise evaluation().  The evaluations are done as one batch by a
+        vectorized.BatchEvaluator.
+
+        Returns: a list of values, one per state
+        """
+        values = [ state.score() if state.is_full() else None for state in states ]
+        open_states = [ state for state, value in zip(states, values) if value is None ]
+        if open_states:
+            evaluator = vectorized.get_evaluator(states[0].num_rows, states[0].num_cols)
+            boards = vectorized.stack_boards(open_states)
+            if self.use_patterns:
+                estimates = evaluator.evaluate_patterns(boards, self.pattern_evaluator(states[0]))
+            else:
+                estimates = evaluator.evaluate(boards, self.streak_weights)
+            estimates = iter(estimates.tolist())
+            values = [ next(estimates) if value is None else value for value in values ]
+        return values
+
+    def pattern_evaluator(self, state):
+        """Return the patterns.PatternEvaluator for the state's board size and self.weights."""
+        return patterns.get_evaluator(state.num_rows, state.num_cols, self.weights)
+
     def evaluation(self, state):
         """Estimate the utility value of the game state based on features.
 
@@ -141,13 +646,19 @@ class HeuristicAgent(MinimaxAgent):
 
         Returns: a heusristic estimate of the utility value of the state
         """
+        if self.use_patterns:
+            # the score so far, plus what the open windows could still add to it
+            return state.score() + state.pattern_value(self.pattern_evaluator(state))
+
         # print("in eval function:")
         # print(state)
 
+        w_pair, w_open, w_run = self.streak_weights
         p1_score = 0
         p2_score = 0
 
-        for run in state.get_all_rows() + state.get_all_cols() + state.get_all_diags():
+        for line in get_geometry(state.num_rows, state.num_cols).lines:
+            run = state.get_line(line)
             # print("run",run)
             # if '0, 1' in str(run):  # checks for ' , x'
             #     print('0, 1')
@@ -161,19 +672,19 @@ class HeuristicAgent(MinimaxAgent):
             # if '-1, 0' in str(run):  # checks for 'o,  '
             #     print('-1, 0')
             #     p2_score += 1
-            for elt, length, score in streaks_eval(run):
+            for elt, length, score in streaks_eval(run, w_open):
                 if elt == 1:
                     p1_score += score
                 if elt == -1:
                     p2_score += score
                 if (elt == 1) and (length >= 3):
-                    p1_score += length ** 2
+                    p1_score += w_run * length ** 2
                 elif (elt == 1) and (length == 2):
-                    p1_score += 5
+                    p1_score += w_pair
                 elif (elt == -1) and (length >= 3):
-                    p2_score += length ** 2
+                    p2_score += w_run * length ** 2
                 elif (elt == -1) and (length == 2):
-                    p2_score += 5
+                    p2_score += w_pair
 
         # print("p1_score :",p1_score)
         # print("p2_score :", p2_score)
@@ -181,8 +692,11 @@ class HeuristicAgent(MinimaxAgent):
         return p1_score - p2_score  # subtract util scores to determine util
 
 
-def streaks_eval(lst):
-    """Return the lengths of all the streaks of the same element in a sequence."""
+def streaks_eval(lst, open_weight=5):
+    """Return the lengths of all the streaks of the same element in a sequence.
+
+    Each streak comes with a score of open_weight per element if the cell after it is empty.
+    """
     rets = []  # list of (element, length) tuples
     prev = lst[0]
     curr_len = 1
@@ -192,7 +706,7 @@ def streaks_eval(lst):
             curr_len += 1
         else:
             if curr == 0:
-                score = curr_len * 5
+                score = curr_len * open_weight
             rets.append((prev, curr_len, score))
             prev = curr
             curr_len = 1
@@ -204,12 +718,79 @@ def streaks_eval(lst):
 class PruneAgent(HeuristicAgent):
     """Smarter computer agent that uses minimax with alpha-beta pruning to select the best move."""
 
+    def __init__(self, tt=None, ordering=False, time_ms=None, workers=None, split_ply=1,
+                 batch_eval=False, book=None, symmetry=False, bounds=False, ponder=False,
+                 use_patterns=False, weights=None, streak_weights=None):
+        """Constructor for an alpha-beta agent.
+
+        Args:
+            tt: optional transposition.TranspositionTable used to remember searched positions
+            ordering: if True, search children in a heuristic order (transposition table move,
+                killer moves, history heuristic, then center columns first) instead of the order
+                returned by GameState.successors().  This prunes more, but breaks the assignment's
+                ordering rule, so it is off by default.
+            time_ms: per-move time budget for iterative deepening (see HeuristicAgent)
+            workers, split_ply: see MinimaxAgent; the parallel search gives up pruning between
+                root moves, but picks the same move
+            batch_eval, ponder, use_patterns, weights, streak_weights: see HeuristicAgent
+            book, symmetry, bounds: see MinimaxAgent
+        """
+        super().__init__(tt, time_ms, workers, split_ply, batch_eval, book, symmetry, bounds,
+                         ponder, use_patterns, weights, streak_weights)
+        self.ordering = ordering
+        self.killers = {}  # ply -> up to two moves that recently caused a cutoff at that ply
+        self.history = {}  # (player, move) -> how much that move has caused cutoffs
+
+    def stop_pondering(self, state=None, depth=None):
+        """Stop pondering (see HeuristicAgent.stop_pondering()) and clear the killer moves.
+
+        Every get_move() stops pondering first, so this is where each search starts with no
+        killer moves, after the pondering thread has been joined so it can't write to them.
+        """
+        pondered = super().stop_pondering(state, depth)
+        self.killers = {}
+        return pondered
+
+    def ponder_replies(self, state, depth):
+        """Ponder (see HeuristicAgent.ponder_replies()) with killer moves and a history table of
+        its own, so the searches of the replies don't change the move ordering of get_move()."""
+        killers, history = self.killers, self.history
+        self.killers, self.history = {}, dict(history)
+        try:
+            super().ponder_replies(state, depth)
+        finally:
+            self.killers, self.history = killers, history
+
+    def search_root(self, state, depth, first_move=None):
+        """Search the root's children with a shared alpha-beta window.
+
+        With ordering turned on, first_move (the previous iteration's best move when deepening)
+        is searched first.
+        """
+        if self.workers:
+            return super().search_root(state, depth, first_move)
+        nextp = state.next_player()
+        alpha = -math.inf
+        beta = math.inf
+        best_move = None
+        best_state = None
+
+        moves = self.order_moves(state, self.search_moves(state, depth), depth, 0, first_move)
+        for move, child in state.lazy_successors(moves):
+            util = self.minimax_prune(child, depth, alpha, beta, 1)
+            if (nextp == 1) and (util > alpha):
+                alpha, best_move, best_state = util, move, child
+            elif (nextp == -1) and (util < beta):
+                beta, best_move, best_state = util, move, child
+        if self.search_stats is not None:
+            self.search_stats.record(0, len(moves), False)
+        self.root_value = alpha if nextp == 1 else beta
+        return best_move, best_state
+
     def minimax(self, state, depth):
         return self.minimax_prune(state, depth)
 
-    def minimax_prune(self, state, depth):
-
-        # print("depth: ", depth)
+    def minimax_prune(self, state, depth, alpha=-math.inf, beta=math.inf, ply=0):
         """Determine the minimax utility value the given state using alpha-beta pruning.
 
         The value should be equal to the one determined by ComputerAgent.minimax(), but the
@@ -220,52 +801,306 @@ class PruneAgent(HeuristicAgent):
         N.B.: When exploring the game tree and expanding nodes, you must consider the child nodes
         in the order that they are returned by GameState.successors().  That is, you cannot prune
         the state reached by moving to column 4 before you've explored the state reached by a move
-        to to column 1.
+        to to column 1.  (Unless self.ordering is turned on.)
 
-        Args: see ComputerDepthLimitAgent.minimax() above
+        Args: see ComputerDepthLimitAgent.minimax() above, plus
+            alpha: the best value the maximizing player can already guarantee higher in the tree
+            beta: the best value the minimizing player can already guarantee higher in the tree
+            ply: how many moves below the root this state is, used for killer moves
 
-        Returns: the minimax utility value of the state
+        Returns: the minimax utility value of the state if it lies strictly between alpha and beta;
+            otherwise a value that is no better than the true value for the player who caused the
+            cutoff (at most alpha, or at least beta)
         """
+        if state.is_full():
+            return state.score()
+
+        if depth == 0:
+            return self.evaluation(state)
+
+        self.check_time()
+        if self.book is not None:
+            solved = self.book.lookup(state)
+            if solved is not None:
+                return solved
+
+        tt_move = None
+        if self.tt is not None:
+            key, flipped = self.tt_key(state, depth)
+            entry = self.tt.probe(key, depth)
+            if entry is not None:
+                if entry.bound == EXACT:
+                    return entry.value
+                elif entry.bound == LOWER:
+                    alpha = max(alpha, entry.value)
+                elif entry.bound == UPPER:
+                    beta = min(beta, entry.value)
+                if alpha >= beta:
+                    return entry.value
+            if self.ordering:
+                tt_move = flip_move(self.tt.best_move(key), flipped, state)
 
-        alpha = -math.inf  # setting alpha to worst possible case for maximizer
-        beta = math.inf  # setting beta to worst possible case for minimizer
+        if self.bounds and depth is None:
+            # the true value lies within the score bounds, so the window can shrink to them
+            lower, upper = state.score_bounds()
+            if upper <= alpha or lower == upper:
+                return upper
+            if lower >= beta:
+                return lower
+            alpha = max(alpha, lower)
+            beta = min(beta, upper)
+        alpha_orig, beta_orig = alpha, beta
 
         nextp = state.next_player()
         best_util = -math.inf if nextp == 1 else math.inf
+        best_move = None
+        child_depth = None if depth is None else depth - 1
+        moves = self.order_moves(state, self.search_moves(state, depth), depth, ply, tt_move)
+        move_states = state.lazy_successors(moves)  # children are only created if reached
+        leaf_utils = None
+        if depth == 1 and self.batch_eval:
+            move_states = list(move_states)
+            leaf_utils = self.leaf_values([s for _, s in move_states])
 
-        if state.is_full():
-            best_util = state.score()
-            return best_util
+        cutoff = False
+        for i, (move, child) in enumerate(move_states):
+            if leaf_utils is not None:
+                util = leaf_utils[i]
+            else:
+                util = self.minimax_prune(child, child_depth, alpha, beta, ply + 1)
+            if nextp == 1:
+                if util > best_util:
+                    best_util, best_move = util, move
+                alpha = max(alpha, util)
+            else:
+                if util < best_util:
+                    best_util, best_move = util, move
+                beta = min(beta, util)
 
-        # print("state :", state)
-        if depth == 0 and depth is not None:
-            # print("depth :", depth)
-            best_util = HeuristicAgent.evaluation(self, state)
-            return best_util
+            if alpha >= beta:  # the opponent will never let the game reach this state
+                if self.ordering:
+                    self.record_cutoff(nextp, move, depth, ply)
+                cutoff = True
+                break
+
+        if self.search_stats is not None:
+            self.search_stats.record(ply, i + 1, cutoff)
 
-        for move, state in state.successors():
-            if depth is None:
-                depth = None
-                util = self.minimax(state, depth)
+        if self.tt is not None:
+            if best_util <= alpha_orig:
+                bound = UPPER
+            elif best_util >= beta_orig:
+                bound = LOWER
             else:
-                util = self.minimax(state, depth - 1)
+                bound = EXACT
+            self.tt.store(key, best_util, depth, bound, flip_move(best_move, flipped, state))
+        return best_util
+
+    def order_moves(self, state, moves, depth, ply, tt_move=None):
+        """Put moves in the order they should be searched.
 
-            # pruning
-            if nextp == -1 and util < alpha:
-                return util
-            if nextp == 1 and util > beta:
-                return util
+        Without self.ordering this is the successors() order.  Otherwise the transposition table's
+        best move comes first, then killer moves for this ply, then moves with the most history
+        credit, with ties going to the column nearest the center.
+        """
+        if not self.ordering:
+            return moves
+        nextp = state.next_player()
+        killers = self.killers.get(ply, ())
+        center = (state.num_cols - 1) / 2
 
-            # setting alpha and beta
-            if nextp == -1 and util > alpha:
-                alpha = util
-            if nextp == 1 and util < beta:
-                beta = util
+        def priority(move):
+            return (move != tt_move,
+                    move not in killers,
+                    -self.history.get((nextp, move), 0),
+                    abs(move - center),
+                    move)
+        return sorted(moves, key=priority)
 
-            # minimax
-            if nextp == 1:
-                best_util = max(best_util, util)
-            elif nextp == -1:
-                best_util = min(best_util, util)
+    def record_cutoff(self, player, move, depth, ply):
+        """Remember a move that caused a cutoff, as a killer move and in the history table."""
+        killers = self.killers.setdefault(ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        weight = 1 if depth is None else depth * depth
+        self.history[(player, move)] = self.history.get((player, move), 0) + weight
 
-        return best_util
+
+class MCTSNode:
+    """A node of an MCTSAgent's search tree."""
+
+    __slots__ = ('state', 'move', 'player', 'parent', 'children', 'untried', 'visits', 'reward')
+
+    def __init__(self, state, move=None, player=None, parent=None):
+        self.state = state
+        self.move = move  # the move that led here from the parent
+        self.player = player  # the player who made that move (1 or -1)
+        self.parent = parent
+        self.children = []
+        self.untried = [] if state.is_full() else state.legal_moves()  # moves not expanded yet
+        self.visits = 0
+        self.reward = 0.0  # total reward of the rollouts through here, for self.player
+
+    def best_child(self, exploration):
+        """Return the child with the highest UCB1 value."""
+        log_visits = math.log(self.visits)
+        return max(self.children, key=lambda child: (
+            child.reward / child.visits + exploration * math.sqrt(log_visits / child.visits)))
+
+
+class MCTSAgent:
+    """Anytime agent that uses Monte Carlo Tree Search (UCT) instead of minimax.
+
+    Each iteration walks down the tree picking the child with the highest UCB1 value, adds one
+    new child, plays a game out from it (see rollout()), and credits every node on the way with
+    a win (1), tie (0.5) or loss (0) for the player who moved into it.  The most visited move is
+    played.  The cost grows with the number of iterations, not with the size of the board.
+    """
+
+    def __init__(self, iterations=None, time_ms=None, heuristic=False, epsilon=0.1,
+                 exploration=math.sqrt(2), batch=1, workers=None, reuse=True, seed=None):
+        """Constructor for an MCTS agent.
+
+        Args:
+            iterations: number of iterations per move (default: 1000, or no limit if time_ms is
+                given)
+            time_ms: if given, stop iterating after this many milliseconds per move
+            heuristic: if True, rollouts follow HeuristicAgent.evaluation() instead of playing
+                random moves (see rollout())
+            epsilon: chance of a random move at each step of a heuristic rollout
+            exploration: the UCB1 exploration constant
+            batch: number of leaves to select before rolling them all out at once; selections
+                within a batch count as losses until their results are in ("virtual loss"), so
+                they spread over different leaves
+            workers: if given, run each batch's rollouts in this many processes
+            reuse: if True, keep the subtree of the position reached when the next move starts
+            seed: seed for the agent's random number generator
+        """
+        if iterations is None and time_ms is None:
+            iterations = 1000
+        if iterations is not None and iterations < 1:
+            raise ValueError("iterations must be at least 1")
+        if time_ms is not None and time_ms <= 0:
+            raise ValueError("time_ms must be positive")
+        if batch < 1:
+            raise ValueError("batch must be at least 1")
+        self.iterations = iterations
+        self.time_ms = time_ms
+        self.heuristic = heuristic
+        self.epsilon = epsilon
+        self.exploration = exploration
+        self.batch = batch
+        self.workers = workers
+        self.reuse = reuse
+        self.rng = random.Random(seed)
+        self.root = None  # the tree left by the last search, for reuse
+        self.root_value = None  # estimated chance of winning with the chosen move
+        self._pool = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pool'] = None  # process pools can't be sent to other processes
+        return state
+
+    def close(self):
+        """Shut down the worker processes, if any were started."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def get_move(self, state, depth=None):
+        """Select the most visited move after searching within the budget.
+
+        The depth argument is ignored, as MCTS doesn't search to a fixed depth.  At least one
+        iteration is run, however short the time budget, so that there is a move to choose.
+        """
+        root = self.find_root(state)
+        deadline = None if self.time_ms is None else time.perf_counter() + self.time_ms / 1000
+        done = 0
+        while done == 0 or ((self.iterations is None or done < self.iterations)
+                            and (deadline is None or time.perf_counter() < deadline)):
+            size = self.batch if self.iterations is None else min(self.batch,
+                                                                  self.iterations - done)
+            self.search_batch(root, size)
+            done += size
+
+        best = max(root.children, key=lambda child: child.visits)
+        self.root_value = best.reward / best.visits
+        self.root = None
+        if self.reuse:
+            self.root = best
+            best.parent = None  # let the rest of the old tree go
+        return best.move, best.state
+
+    def find_root(self, state):
+        """Return the tree node for a state, reusing the previous search's tree if it reached
+        the state (normally one move by the opponent after the previous move), else a new one."""
+        if self.reuse and self.root is not None:
+            key = state.zobrist_hash()
+            nodes = [self.root]
+            for _ in range(2):
+                for node in nodes:
+                    if node.state.zobrist_hash() == key and node.state.board == state.board:
+                        node.parent = None
+                        return node
+                nodes = [ child for node in nodes for child in node.children ]
+        return MCTSNode(state)
+
+    def search_batch(self, root, size):
+        """Run size iterations: select and expand size leaves, roll them out, back them up."""
+        leaves = [ self.select(root) for _ in range(size) ]
+        open_leaves = [ leaf for leaf in leaves if not leaf.state.is_full() ]
+        scores = iter(self.rollout_scores([ leaf.state for leaf in open_leaves ]))
+        for leaf in leaves:
+            score = leaf.state.score() if leaf.state.is_full() else next(scores)
+            self.back_up(leaf, score)
+
+    def select(self, root):
+        """Walk down from the root by UCB1 and expand one new child.
+
+        Every node on the path gets its visit counted straight away (the virtual loss).
+
+        Returns: the new leaf (or a terminal node)
+        """
+        node = root
+        node.visits += 1
+        while not node.untried and node.children:
+            node = node.best_child(self.exploration)
+            node.visits += 1
+        if node.untried:
+            move = node.untried.pop(self.rng.randrange(len(node.untried)))
+            child = MCTSNode(node.state.create_successor(move), move,
+                             node.state.next_player(), node)
+            node.children.append(child)
+            node = child
+            node.visits += 1
+        return node
+
+    def back_up(self, node, score):
+        """Credit the result of a rollout to every node from a leaf up to the root."""
+        p1_reward = 1.0 if score > 0 else 0.0 if score < 0 else 0.5
+        while node is not None:
+            if node.player is not None:
+                node.reward += p1_reward if node.player == 1 else 1.0 - p1_reward
+            node = node.parent
+
+    def rollout_scores(self, states):
+        """Roll out each state once, in the worker processes if there are any.
+
+        Returns: a list of final scores, one per state
+        """
+        if not self.workers or len(states) < 2:
+            return [ rollout(state, self.rng, self.heuristic, self.epsilon) for state in states ]
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers)
+        chunks = [ states[i::self.workers] for i in range(self.workers) ]
+        chunks = [ chunk for chunk in chunks if chunk ]
+        seeds = [ self.rng.getrandbits(64) for _ in chunks ]
+        results = self._pool.map(_rollout_batch, chunks, [self.heuristic] * len(chunks),
+                                 [self.epsilon] * len(chunks), seeds)
+        # chunk i holds states i, i + workers, i + 2 * workers, ...; put the scores back in order
+        scores = [None] * len(states)
+        for i, chunk_scores in enumerate(results):
+            scores[i::self.workers] = chunk_scores
+        return scores
@@ -0,0 +1,195 @@
+"""Benchmarks for the search agents' throughput.
+
+Runs MinimaxAgent, HeuristicAgent and PruneAgent on every test_boards position and on a set of
+generated midgame positions, at fixed depths, and reports for each run the number of states
+generated (GameState.state_count), states per second, time to move, and the chosen move's value.
+
+    python benchmark.py --save baseline.json          # record a baseline
+    python benchmark.py --compare baseline.json       # flag regressions against it
+    python benchmark.py --positions mid_6x7.pos --limit 50   # add positions from a file
+
+MinimaxAgent ignores depth limits, so it only runs on positions with few enough empty cells
+(--minimax-max-empty).
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+from agents import MinimaxAgent, HeuristicAgent, PruneAgent
+from connect383 import GameState, load_test_board
+from positions import read_positions
+import test_boards
+
+
+AGENTS = { 'minimax': MinimaxAgent,
+           'heuristic': HeuristicAgent,
+           'prune': PruneAgent }
+
+
+def empty_cells(state):
+    """Count the empty cells of a state."""
+    return sum(1 for r in range(state.num_rows) for c in range(state.num_cols)
+               if state.get_cell(r, c) == 0)
+
+
+def midgame_positions(sizes, count, seed=0):
+    """Generate midgame positions by playing random moves from empty boards.
+
+    Each position is a third to two thirds of the way through its game, and the same seed always
+    gives the same positions.
+
+    Returns: a list of (label, state) pairs
+    """
+    rng = random.Random(seed)
+    positions = []
+    for nrows, ncols in sizes:
+        for i in range(count):
+            state = GameState(nrows, ncols)
+            cells = nrows * ncols
+            for _ in range(rng.randint(cells // 3, 2 * cells // 3)):
+                state = rng.choice(state.successors())[1]
+            positions.append(("mid_{}x{}_{}".format(nrows, ncols, i), state))
+    return positions
+
+
+def benchmark_positions(sizes, count, seed=0):
+    """Return the (label, state) pairs to benchmark: all non-empty test boards, then midgames."""
+    positions = [ (label, load_test_board(label))
+                  for label, board in test_boards.boards.items() if board ]
+    return positions + midgame_positions(sizes, count, seed)
+
+
+def file_positions(path, limit=None):
+    """Return (label, state) pairs for the first limit positions of a position file."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    return [ ("{}_{}".format(name, i), state)
+             for i, state in enumerate(itertools.islice(read_positions(path), limit)) ]
+
+
+def run_search(agent_name, state, depth, repeat=1):
+    """Time one agent choosing a move from a state.
+
+    The search is repeated with a fresh agent and the fastest time is kept.
+
+    Returns: a result dict with nodes, seconds, nodes per second, move and value
+    """
+    best_seconds = None
+    for _ in range(repeat):
+        agent = AGENTS[agent_name]()
+        count_prev = GameState.state_count
+        start = time.perf_counter()
+        move, _ = agent.get_move(state, depth)
+        seconds = time.perf_counter() - start
+        nodes = GameState.state_count - count_prev
+        if best_seconds is None or seconds < best_seconds:
+            best_seconds = seconds
+    return { 'nodes': nodes,
+             'seconds': round(best_seconds, 6),
+             'nps': round(nodes / best_seconds) if best_seconds > 0 else None,
+             'move': move,
+             'value': agent.root_value }
+
+
+def run_benchmarks(positions, depths, agent_names, minimax_max_empty, repeat=1):
+    """Benchmark every agent on every position at every depth.
+
+    Returns: a dict of "agent/position/depth" -> result dict (see run_search())
+    """
+    results = {}
+    for label, state in positions:
+        for name in agent_names:
+            if name == 'minimax':
+                if empty_cells(state) > minimax_max_empty:
+                    continue
+                run_depths = [None]
+            else:
+                run_depths = depths
+            for depth in run_depths:
+                key = "{}/{}/{}".format(name, label, depth)
+                results[key] = run_search(name, state, depth, repeat)
+    return results
+
+
+def format_results(results):
+    """Format benchmark results as an aligned text table."""
+    lines = [ "{:<40}{:>10}{:>12}{:>12}{:>6}{:>8}".format(
+        "agent/position/depth", "nodes", "seconds", "nodes/s", "move", "value") ]
+    for key, r in results.items():
+        lines.append("{:<40}{:>10}{:>12.4f}{:>12}{:>6}{:>8}".format(
+            key, r['nodes'], r['seconds'], str(r['nps']), str(r['move']), str(r['value'])))
+    return "\n".join(lines)
+
+
+def compare(baseline, results, threshold):
+    """Compare results with a baseline.
+
+    Node counts or times that grew by more than the threshold fraction, and moves or values that
+    changed, are reported as regressions.
+
+    Returns: a list of regression messages
+    """
+    regressions = []
+    for key, new in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        if new['nodes'] > old['nodes'] * (1 + threshold):
+            regressions.append("{}: nodes {} -> {}".format(key, old['nodes'], new['nodes']))
+        if new['seconds'] > old['seconds'] * (1 + threshold):
+            regressions.append("{}: seconds {:.4f} -> {:.4f}".format(
+                key, old['seconds'], new['seconds']))
+        if (new['move'], new['value']) != (old['move'], old['value']):
+            regressions.append("{}: move/value {}/{} -> {}/{}".format(
+                key, old['move'], old['value'], new['move'], new['value']))
+    return regressions
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agents', nargs='+', choices=AGENTS.keys(), default=list(AGENTS))
+    parser.add_argument('--depths', nargs='+', type=int, default=[2, 4])
+    parser.add_argument('--sizes', nargs='*', default=['6x7', '5x6'], metavar='ROWSxCOLS',
+                        help="board sizes for generated midgame positions")
+    parser.add_argument('--midgames', type=int, default=3,
+                        help="number of midgame positions per size")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--positions', metavar='FILE',
+                        help="also benchmark the positions in a position file (see positions.py)")
+    parser.add_argument('--limit', type=int, help="only use this many positions from --positions")
+    parser.add_argument('--minimax-max-empty', type=int, default=10,
+                        help="only run the exact minimax agent with this many empty cells or fewer")
+    parser.add_argument('--repeat', type=int, default=1, help="keep the fastest of this many runs")
+    parser.add_argument('--save', metavar='FILE', help="write the results as a baseline file")
+    parser.add_argument('--compare', metavar='FILE', help="compare against a baseline file")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="fraction a node count or time may grow before it is a regression")
+    args = parser.parse_args()
+
+    sizes = [ tuple(int(n) for n in size.split('x')) for size in args.sizes ]
+    positions = benchmark_positions(sizes, args.midgames, args.seed)
+    if args.positions:
+        positions += file_positions(args.positions, args.limit)
+    results = run_benchmarks(positions, args.depths, args.agents, args.minimax_max_empty,
+                             args.repeat)
+    print(format_results(results))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1)
+        print("Baseline written to", args.save)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold)
+        for message in regressions:
+            print("REGRESSION", message)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against", args.compare)
@@ -0,0 +1,270 @@
+"""Bitboard-backed game state for Connect383.
+
+BitboardState is a drop-in alternative to connect383.GameState for search code.  Instead of a
+list of lists, each player's pieces are kept as a single integer bitmask, plus a height for every
+column.  Moves can be made and taken back in place with play() and undo(), so a search can walk
+the game tree without copying boards.
+
+Bit layout: each column takes (nrows + 1) consecutive bits, bottom cell first, with an always-empty
+"sentinel" bit on top.  With this layout a shift by 1 moves one cell up a column, a shift by
+(nrows + 1) moves one cell across a row, and shifts by nrows and (nrows + 2) follow the two
+diagonals.  The sentinel bits keep runs from wrapping from one column into the next.
+"""
+
+from geometry import get_geometry
+
+
+def popcount(bits):
+    """Count the set bits in a non-negative integer."""
+    return bin(bits).count("1")
+
+
+def run_score(bits, shift):
+    """Score all runs of 3+ set bits in one direction of a bitmask.
+
+    A run of length L scores L**2, as in GameState.score().  If c_k is the number of length-k
+    windows that are completely set, then c_k - c_(k+1) is the number of runs of length k or more,
+    so the total can be built up one window length at a time.
+    """
+    windows = bits & (bits >> shift) & (bits >> (2 * shift))  # windows of length 3
+    count = popcount(windows)
+    total = 0
+    k = 3
+    while count:
+        windows &= bits >> (k * shift)  # windows of length k + 1
+        next_count = popcount(windows)
+        total += (count - next_count) * (9 if k == 3 else 2 * k - 1)
+        count = next_count
+        k += 1
+    return total
+
+
+class BitboardState:
+    """Game state that stores each player's pieces as an integer bitmask.
+
+    Supports the same successors(), score(), is_full(), next_player() and __str__ interface as
+    GameState, so the agents can search over either one.  On top of that, play(col) and undo()
+    change the state in place, which lets a search make and unmake moves in O(1).
+    """
+
+    state_count = 0  # bookkeeping, same as GameState.state_count
+
+    def __init__(self, nrows=6, ncols=7):
+        """Constructor for an empty bitboard state.
+
+        Args:
+            nrows: number of rows in the board
+            ncols: number of columns in the board
+        """
+        self.num_rows = nrows
+        self.num_cols = ncols
+        self.col_bits = nrows + 1  # bits per column, including the sentinel on top
+        self.p1 = 0  # Player 1's pieces
+        self.p2 = 0  # Player 2's pieces
+        self.p1_count = 0
+        self.p2_count = 0
+        self.heights = [0] * ncols  # lowest empty row in each column
+        self.moves = []  # stack of (col, row) moves made with play(), for undo()
+
+    @classmethod
+    def from_state(cls, state):
+        """Build a bitboard state from any state exposing num_rows, num_cols and get_cell()."""
+        bb = cls(state.num_rows, state.num_cols)
+        for c in range(state.num_cols):
+            for r in range(state.num_rows):
+                val = state.get_cell(r, c)
+                bit = 1 << (c * bb.col_bits + r)
+                if val == 1:
+                    bb.p1 |= bit
+                    bb.p1_count += 1
+                elif val == -1:
+                    bb.p2 |= bit
+                    bb.p2_count += 1
+            bb.heights[c] = bb._find_height(c)
+        return bb
+
+    def _find_height(self, col, start=0):
+        """Locate the row a new piece in the given column lands in (same rule as GameState).
+
+        Returns num_rows if the column is full.
+        """
+        mask = (self.p1 | self.p2) >> (col * self.col_bits)
+        if (mask >> (self.num_rows - 1)) & 1:
+            return self.num_rows
+        row = start
+        while (mask >> row) & 1:
+            row += 1
+        return row
+
+    def copy(self):
+        """Create a duplicate of this game state."""
+        clone = BitboardState.__new__(BitboardState)
+        clone.num_rows = self.num_rows
+        clone.num_cols = self.num_cols
+        clone.col_bits = self.col_bits
+        clone.p1 = self.p1
+        clone.p2 = self.p2
+        clone.p1_count = self.p1_count
+        clone.p2_count = self.p2_count
+        clone.heights = self.heights[:]
+        clone.moves = self.moves[:]
+        return clone
+
+    def next_player(self):
+        """Determines who's move it is based on the board state.
+
+        Returns: 1 if Player 1 goes next, -1 if it's Player 2's turn
+        """
+        return 1 if self.p1_count == self.p2_count else -1
+
+    def can_play(self, col):
+        """Checks whether the given column still has room for a piece."""
+        return self.heights[col] < self.num_rows
+
+    def legal_moves(self):
+        """Returns a sorted list of the columns that still have room for a piece."""
+        return [ col for col in range(self.num_cols) if self.heights[col] < self.num_rows ]
+
+    def play(self, col):
+        """Drop the next player's piece into a column, modifying this state in place."""
+        row = self.heights[col]
+        if row >= self.num_rows:
+            raise ValueError("column {} is full".format(col))
+        bit = 1 << (col * self.col_bits + row)
+        if self.p1_count == self.p2_count:
+            self.p1 |= bit
+            self.p1_count += 1
+        else:
+            self.p2 |= bit
+            self.p2_count += 1
+        self.moves.append((col, row))
+        self.heights[col] = self._find_height(col, row + 1)
+        BitboardState.state_count += 1  # bookkeeping
+
+    def undo(self):
+        """Take back the last move made with play()."""
+        col, row = self.moves.pop()
+        bit = 1 << (col * self.col_bits + row)
+        if self.p1 & bit:
+            self.p1 ^= bit
+            self.p1_count -= 1
+        else:
+            self.p2 ^= bit
+            self.p2_count -= 1
+        self.heights[col] = row
+
+    def create_successor(self, col):
+        """Create the successor state that follows from a given move."""
+        successor = self.copy()
+        successor.play(col)
+        return successor
+
+    def successors(self):
+        """Generates successor state objects for all valid moves from this board.
+
+        Returns: a _sorted_ list of (move, state) tuples
+        """
+        return [(col, self.create_successor(col)) for col in range(self.num_cols)
+                if self.heights[col] < self.num_rows]
+
+    def lazy_successors(self, moves=None):
+        """Generates the same (move, state) tuples as successors(), one at a time.
+
+        Args:
+            moves: the columns to play, in the order to generate them (default: legal_moves())
+        """
+        if moves is None:
+            moves = self.legal_moves()
+        for col in moves:
+            yield col, self.create_successor(col)
+
+    # Accessors matching GameState, so evaluation functions work unchanged
+
+    @property
+    def geometry(self):
+        """The shared geometry.BoardGeometry for this board's size."""
+        return get_geometry(self.num_rows, self.num_cols)
+
+    def get_cell(self, r, c):
+        """Gets the current value for any cell in the board."""
+        shift = c * self.col_bits + r
+        if (self.p1 >> shift) & 1:
+            return 1
+        if (self.p2 >> shift) & 1:
+            return -1
+        return 0
+
+    @property
+    def board(self):
+        """The board as a tuple of rows, in the same layout as GameState.board."""
+        return tuple(tuple(self.get_cell(r, c) for c in range(self.num_cols))
+                     for r in range(self.num_rows))
+
+    def get_row(self, r):
+        """Gets the current values for any row in the board."""
+        return [self.get_cell(r, c) for c in range(self.num_cols)]
+
+    def get_col(self, c):
+        """Gets the current values for any column in the board as a list."""
+        return [self.get_cell(r, c) for r in range(self.num_rows)]
+
+    def get_line(self, cells):
+        """Gets the current values for a list of (row, col) cells."""
+        return [ self.get_cell(r, c) for r, c in cells ]
+
+    def get_all_rows(self):
+        """Return a list of rows for the board."""
+        return [ self.get_row(r) for r in range(self.num_rows) ]
+
+    def get_all_cols(self):
+        """Return a list of columns for the board."""
+        return [ [ self.get_cell(r, c) for r, c in col ] for col in self.geometry.cols ]
+
+    def get_all_diags(self):
+        """Return a list of all the diagonals for the board."""
+        return [ [ self.get_cell(r, c) for r, c in diag ] for diag in self.geometry.diags ]
+
+    def score(self):
+        """Calculate the score for each player.
+
+        Players are awarded points for each streak (horizontal, vertical, or diagonal) of length 3
+        or greater equal to the square of the length (e.g., 4-in-a-row scores 16 points).
+        """
+        return self._score(self.p1, self.p2)
+
+    def _score(self, p1, p2):
+        shifts = (1, self.col_bits, self.col_bits - 1, self.col_bits + 1)
+        p1_score = sum(run_score(p1, s) for s in shifts)
+        p2_score = sum(run_score(p2, s) for s in shifts)
+        return p1_score - p2_score
+
+    def score_bounds(self):
+        """Return the lowest and highest final score the game can still end with (see
+        GameState.score_bounds()): the scores with every empty cell given to Player 2, and to
+        Player 1."""
+        column = (1 << self.num_rows) - 1
+        cells = sum(column << (c * self.col_bits) for c in range(self.num_cols))
+        empty = cells & ~(self.p1 | self.p2)
+        return self._score(self.p1, self.p2 | empty), self._score(self.p1 | empty, self.p2)
+
+    def is_full(self):
+        """Checks to see if there are available moves left."""
+        return self.p1_count + self.p2_count == self.num_rows * self.num_cols
+
+    def winner(self):
+        s = self.score()
+        return 0 if s == 0 else s / abs(s)
+
+    def __str__(self):
+        symbols = { -1: "O", 1: "X", 0: "-" }
+        s = ""
+        for r in range(self.num_rows-1, -1, -1):
+            s += "\n"
+            for c in range(self.num_cols):
+                s += "  " + symbols[self.get_cell(r, c)]
+
+        s += "\n  " + "." * (self.num_cols * 3 - 2) + "\n"
+        for c in range(self.num_cols):
+            s += "  " + str(c)
+        s += "\n"
+        return s
@@ -0,0 +1,195 @@
+"""Solved-position book: exact minimax values for every reachable position of a small board.
+
+For small boards, every position reachable from the empty board can be solved once and stored on
+disk, so agents can look positions up instead of searching them again.  The book file is a sorted
+array of position keys followed by their values; BookReader memory-maps it and binary-searches
+the keys, so nothing is loaded into Python objects up front.
+
+    python book.py 4 4 --out book_4x4.bin
+
+File layout (little-endian):
+    header: magic b"C383BOOK", version (uint16), nrows (uint8), ncols (uint8), padding (uint32),
+            count (uint64)
+    keys:   count uint64 canonical position keys (see canonical_key()), sorted
+    values: count int32 minimax values, in the same order
+"""
+
+import argparse
+import mmap
+import struct
+import time
+
+from bitboard import BitboardState
+
+
+MAGIC = b"C383BOOK"
+VERSION = 2
+HEADER = struct.Struct("<8sHBBIQ")
+KEY = struct.Struct("<Q")
+VALUE = struct.Struct("<i")
+
+
+def position_key(state):
+    """Return the book key of a position, or None if it can't have one.
+
+    The key packs the board column by column, (nrows + 1) bits per column: a bit for each of
+    Player 1's pieces, plus a marker bit just above the column's top piece.  This is unique for
+    every position that obeys gravity; boards with gaps get None.  Book files store keys as
+    64-bit integers, so only boards with (nrows + 1) * ncols <= 64 can have a book, but
+    positions.py uses the same keys for boards of any size.
+    """
+    nrows, ncols = state.num_rows, state.num_cols
+    key = 0
+    for c in range(ncols):
+        height = 0
+        bits = 0
+        for r in range(nrows):
+            val = state.get_cell(r, c)
+            if val == 0:
+                break
+            if val == 1:
+                bits |= 1 << r
+            height += 1
+        for r in range(height + 1, nrows):
+            if state.get_cell(r, c) != 0:
+                return None  # a piece floating above a gap
+        key |= (bits | (1 << height)) << (c * (nrows + 1))
+    return key
+
+
+def canonical_key(key, nrows, ncols):
+    """Return the smaller of a position key and the key of its mirror image.
+
+    A position and its mirror image have the same value, so the book stores only one of them.
+    Mirroring a key just reverses the order of its (nrows + 1)-bit column chunks.
+    """
+    col_bits = nrows + 1
+    mask = (1 << col_bits) - 1
+    mirrored = 0
+    for c in range(ncols):
+        mirrored |= ((key >> (c * col_bits)) & mask) << ((ncols - 1 - c) * col_bits)
+    return min(key, mirrored)
+
+
+def bitboard_key(bb):
+    """Return position_key() of a BitboardState, computed straight from its bitmasks."""
+    bottom = sum(1 << (c * bb.col_bits) for c in range(bb.num_cols))
+    return bb.p1 + (bb.p1 | bb.p2) + bottom
+
+
+def solve_positions(nrows, ncols):
+    """Find the exact minimax value of every position reachable from the empty board.
+
+    Returns: a dict of canonical position key -> value (see canonical_key())
+    """
+    values = {}
+    bb = BitboardState(nrows, ncols)
+    bottom = sum(1 << (c * bb.col_bits) for c in range(ncols))
+
+    def solve():
+        key = canonical_key(bb.p1 + (bb.p1 | bb.p2) + bottom, nrows, ncols)
+        value = values.get(key)
+        if value is not None:
+            return value
+        if bb.is_full():
+            value = bb.score()
+        else:
+            maximize = bb.next_player() == 1
+            for col in range(ncols):
+                if bb.can_play(col):
+                    bb.play(col)
+                    util = solve()
+                    bb.undo()
+                    if value is None or (util > value if maximize else util < value):
+                        value = util
+        values[key] = value
+        return value
+
+    solve()
+    return values
+
+
+def write_book(path, nrows, ncols, values):
+    """Write a dict of position key -> value as a book file."""
+    keys = sorted(values)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, nrows, ncols, 0, len(keys)))
+        f.write(struct.pack("<{}Q".format(len(keys)), *keys))
+        f.write(struct.pack("<{}i".format(len(keys)), *(values[k] for k in keys)))
+
+
+class BookReader:
+    """Looks positions up in a book file through a read-only memory map."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.num_rows, self.num_cols, _, self.count = HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a version {} book file".format(path, VERSION))
+        self.keys_offset = HEADER.size
+        self.values_offset = self.keys_offset + KEY.size * self.count
+        self.lookups = 0
+        self.hits = 0
+
+    def find(self, key):
+        """Binary-search for a position key; returns its value, or None if it isn't in the book."""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if KEY.unpack_from(self.mm, self.keys_offset + KEY.size * mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and KEY.unpack_from(self.mm, self.keys_offset + KEY.size * lo)[0] == key:
+            return VALUE.unpack_from(self.mm, self.values_offset + VALUE.size * lo)[0]
+        return None
+
+    def lookup(self, state):
+        """Return the exact minimax value of a state, or None if the book doesn't have it."""
+        if (state.num_rows, state.num_cols) != (self.num_rows, self.num_cols):
+            return None
+        self.lookups += 1
+        key = position_key(state)
+        value = None if key is None else self.find(
+            canonical_key(key, self.num_rows, self.num_cols))
+        if value is not None:
+            self.hits += 1
+        return value
+
+    def __len__(self):
+        return self.count
+
+    def __getstate__(self):
+        return self.path  # memory maps can't be pickled; worker processes reopen the file
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    def close(self):
+        self.mm.close()
+
+    def stats(self):
+        """Summarize the lookup counters as a string."""
+        return "{} hits in {} lookups".format(self.hits, self.lookups)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('nrows', type=int)
+    parser.add_argument('ncols', type=int)
+    parser.add_argument('--out', help="book file to write (default: book_<nrows>x<ncols>.bin)")
+    args = parser.parse_args()
+
+    if (args.nrows + 1) * args.ncols > 64:
+        parser.error("board is too big for 64-bit position keys")
+    start = time.perf_counter()
+    values = solve_positions(args.nrows, args.ncols)
+    out = args.out or "book_{}x{}.bin".format(args.nrows, args.ncols)
+    write_book(out, args.nrows, args.ncols, values)
+    empty_value = values[canonical_key(bitboard_key(BitboardState(args.nrows, args.ncols)),
+                                       args.nrows, args.ncols)]
+    print("Solved {} positions in {:.1f}s (empty board value {}), written to {}".format(
+        len(values), time.perf_counter() - start, empty_value, out))
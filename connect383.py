@@ -1,9 +1,35 @@
 import sys
 import argparse
-from agents import RandomAgent, HumanAgent, MinimaxAgent, HeuristicAgent, PruneAgent
+import json
+import random
+import time
+from array import array
+from agents import RandomAgent, HumanAgent, MinimaxAgent, HeuristicAgent, PruneAgent, MCTSAgent
+from transposition import TranspositionTable
+from book import BookReader
+from geometry import get_geometry
+import patterns
+import profiling
 import test_boards
 
 
+_zobrist_keys = {}  # (nrows, ncols) -> table of random keys, see zobrist_keys()
+
+
+def zobrist_keys(nrows, ncols):
+    """Return the Zobrist keys for a board size: one random 64-bit number per (row, col, player).
+
+    The keys are seeded from the board size, so every process gets the same hashes.
+    """
+    keys = _zobrist_keys.get((nrows, ncols))
+    if keys is None:
+        rng = random.Random("zobrist {}x{}".format(nrows, ncols))
+        keys = [ [ { 1: rng.getrandbits(64), -1: rng.getrandbits(64) } for c in range(ncols) ]
+                 for r in range(nrows) ]
+        _zobrist_keys[(nrows, ncols)] = keys
+    return keys
+
+
 class GameState:
     """Class representing a single state of a Connect4-esque game.
 
@@ -12,12 +38,19 @@ class GameState:
     Once created, a game state object should usually not be modified; instead, use the successors()
     function to generate reachable states.
 
-    The board is stored as a 2D list, containing 1's representing Player 1's pieces and -1's
-    for Player 2 (unused spaces are 0).
+    The board is stored compactly, as one flat array of signed bytes (cells[r * num_cols + c]),
+    containing 1's representing Player 1's pieces and -1's for Player 2 (unused spaces are 0).
+    The board property gives it as a 2D list of rows for code that wants one.  States use
+    __slots__ and keep their piece count and balance cached, so a state costs a couple of hundred
+    bytes and millions of them can be held in memory at once.
     """
-    
+
+    __slots__ = ('num_rows', 'num_cols', 'cells', '_pieces', '_balance', '_score', '_hash',
+                 '_mirror_hash', '_bounds', '_bounds_move', '_patterns')
+
     state_count = 0  # bookkeeping to help track how efficient agents' search methods are running
-    
+    verify_score = False  # if True, score() and score_bounds() cross-check against a rescan
+
     def __init__(self, nrows=6, ncols=7):
         """Constructor for Connect4 state.
 
@@ -28,14 +61,58 @@ class GameState:
         """
         self.num_rows = nrows
         self.num_cols = ncols
-        self.board = [ [ 0 for x in range(ncols) ] for y in range(nrows) ]
+        self.cells = array('b', bytes(nrows * ncols))
+        self._pieces = 0  # number of pieces on the board
+        self._balance = 0  # Player 1's pieces minus Player 2's, which decides who moves next
+        self._score = None  # score of the board, kept up to date by create_successor()
+        self._hash = None  # Zobrist hash of the board, likewise
+        self._mirror_hash = None  # Zobrist hash of the board with its columns reversed
+        self._bounds = None  # cached score_bounds()
+        self._bounds_move = None  # (parent's bounds, row, col) to update them from, see below
+        self._patterns = None  # (evaluator, value) cached by pattern_value()
+
+    @property
+    def board(self):
+        """The board as a tuple of rows, each a tuple of values.
+
+        The board is built from the cells on each access, so it is read-only: writing to it
+        raises a TypeError instead of silently changing a copy.  Assign a whole 2D list to the
+        property to replace the board.
+        """
+        n = self.num_cols
+        cells = self.cells
+        return tuple(tuple(cells[r * n:(r + 1) * n]) for r in range(self.num_rows))
+
+    @board.setter
+    def board(self, rows):
+        self.cells = array('b', [ val for row in rows for val in row ])
+        self._board_changed()
+
+    def _board_changed(self):
+        """Recount the pieces and forget the cached score and hashes after an arbitrary edit."""
+        self._pieces = len(self.cells) - self.cells.count(0)
+        self._balance = sum(self.cells)
+        self._score = None
+        self._hash = None
+        self._mirror_hash = None
+        self._bounds = None
+        self._bounds_move = None
+        self._patterns = None
 
     def copy(self):
         """Create a duplicate of this game state."""
-        clone = GameState(self.num_rows, self.num_cols)
-        for r in range(self.num_rows):
-            for c in range(self.num_cols):
-                clone.board[r][c] = self.board[r][c]
+        clone = GameState.__new__(GameState)
+        clone.num_rows = self.num_rows
+        clone.num_cols = self.num_cols
+        clone.cells = self.cells[:]
+        clone._pieces = self._pieces
+        clone._balance = self._balance
+        clone._score = self._score
+        clone._hash = self._hash
+        clone._mirror_hash = self._mirror_hash
+        clone._bounds = self._bounds
+        clone._bounds_move = self._bounds_move  # still pending for the same board
+        clone._patterns = self._patterns
         return clone
 
     def next_player(self):
@@ -43,103 +120,265 @@ class GameState:
 
         Returns: 1 if Player 1 goes next, -1 if it's Player 2's turn
         """
-        return 1 if sum(sum(self.board, [])) == 0 else -1  # 1 for Player 1, -1 for Player 2
+        return 1 if self._balance == 0 else -1  # 1 for Player 1, -1 for Player 2
 
     def create_successor(self, col):
         """Create the successor state that follows from a given move."""
         player = self.next_player()
         successor = self.copy()
-        row = 0
-        while (successor.board[row][col] != 0) and (row < successor.num_rows-1):
-            row += 1
-        successor.board[row][col] = player
+        cells = successor.cells
+        ncols = self.num_cols
+        i = col
+        top = (self.num_rows - 1) * ncols + col
+        while (cells[i] != 0) and (i < top):
+            i += ncols
+        if cells[i] == 0:
+            cells[i] = player
+            row = i // ncols
+            successor._pieces += 1
+            successor._balance += player
+            successor._score = self.score() + successor.score_delta(row, col)
+            keys = zobrist_keys(self.num_rows, ncols)
+            successor._hash = self.zobrist_hash() ^ keys[row][col][player]
+            successor._mirror_hash = self._mirror_hash ^ keys[row][ncols-1-col][player]
+            # the bounds are only updated if they're asked for, as searches often don't need them
+            # (if the parent's own bounds were never computed, the successor's are found by a
+            # rescan rather than from bounds that don't match its parent's board)
+            successor._bounds = None
+            successor._bounds_move = None if self._bounds is None else (self._bounds, row, col)
+            if self._patterns is not None:
+                evaluator, value = self._patterns
+                successor._patterns = (evaluator, value + evaluator.delta(cells, i))
+        else:
+            cells[i] = player
+            successor._board_changed()
         GameState.state_count += 1  # bookkeeping, 
         return successor
 
+    def zobrist_hash(self):
+        """Return a 64-bit hash of the board, XORing together a key for every piece on it.
+
+        Like the score, the hash is computed from scratch once and then updated by
+        create_successor().
+        """
+        if self._hash is None:
+            keys = zobrist_keys(self.num_rows, self.num_cols)
+            h = 0
+            h_mirror = 0
+            for r in range(self.num_rows):
+                for c in range(self.num_cols):
+                    val = self.get_cell(r, c)
+                    if val != 0:
+                        h ^= keys[r][c][val]
+                        h_mirror ^= keys[r][self.num_cols-1-c][val]
+            self._hash = h
+            self._mirror_hash = h_mirror
+        return self._hash
+
+    # Connect383 scoring doesn't change if the board is mirrored left to right, so a board and
+    # its mirror image can share search results (see the agents' symmetry option)
+
+    def _mirrored_cells(self):
+        """Return the cells array of this board with its columns in reverse order."""
+        n = self.num_cols
+        cells = self.cells
+        mirrored = array('b')
+        for r in range(self.num_rows):
+            mirrored.extend(cells[r * n:(r + 1) * n][::-1])
+        return mirrored
+
+    def canonical_hash(self):
+        """Return a hash shared by this board and its mirror image: the smaller of their hashes.
+
+        This is the canonical form search caches key on: picking the smaller hash rather than the
+        lexicographically smaller board costs nothing, as both hashes are kept up to date move by
+        move, and no mirrored state has to be built.  (Solved-position books key on
+        book.canonical_key(), the smaller of the two boards' position keys.)
+
+        Returns: a (hash, mirrored) tuple, where mirrored says whether the hash is the mirror
+            image's; moves stored under the hash should be flipped if so
+        """
+        h = self.zobrist_hash()
+        if self._mirror_hash < h:
+            return self._mirror_hash, True
+        return h, False
+
+    def is_symmetric(self):
+        """Checks whether the board is its own mirror image."""
+        self.zobrist_hash()
+        return self._hash == self._mirror_hash and self._mirrored_cells() == self.cells
+
+    def legal_moves(self):
+        """Returns a sorted list of the columns that still have room for a piece."""
+        top = (self.num_rows - 1) * self.num_cols
+        cells = self.cells
+        return [ col for col in range(self.num_cols) if cells[top + col] == 0 ]
+
     def successors(self):
         """Generates successor state objects for all valid moves from this board.
 
         Returns: a _sorted_ list of (move, state) tuples
         """
-        move_states = []
-        for col in range(self.num_cols):
-            if self.board[self.num_rows-1][col] == 0:
-                move_states.append((col, self.create_successor(col)))        
-        return move_states
+        return [ (col, self.create_successor(col)) for col in self.legal_moves() ]
+
+    def lazy_successors(self, moves=None):
+        """Generates the same (move, state) tuples as successors(), one at a time.
+
+        Each successor state is only created when the caller asks for it, so a search that stops
+        early (e.g. on an alpha-beta cutoff) never builds, or counts, the states it skips.
+
+        Args:
+            moves: the columns to play, in the order to generate them (default: legal_moves())
+        """
+        if moves is None:
+            moves = self.legal_moves()
+        for col in moves:
+            yield col, self.create_successor(col)
 
     # These accessor methods might be useful for calculation an agent's evaluation method!
 
     def get_row(self, r):
         """Gets the current values for any row in the board."""
-        return self.board[r]
+        return self.cells[r * self.num_cols:(r + 1) * self.num_cols].tolist()
 
     def get_col(self, c):
         """Gets the current values for any column in the board as a list."""
-        return [ self.board[r][c] for r in range(self.num_rows) ]
+        return self.cells[c::self.num_cols].tolist()
         
     def get_cell(self, r, c):
         """Gets the current value for any cell in the board as a list."""
-        return self.board[r][c]
+        return self.cells[r * self.num_cols + c]
 
     def get_diags(self, cross_r, cross_c):
         """Returns the values for the diagonals crossing at any particular cell as two lists."""
-        diag_up = []
-        diag_down = []
-        for c in range(self.num_cols):
-            # "up" diagonal
-            r = cross_r - (cross_c - c)
-            if (0 <= r) and (r < self.num_rows):
-                diag_up.append(self.board[r][c]) 
-
-            # "down" diagonal
-            r = cross_r + (cross_c - c)
-            if (0 <= r) and (r < self.num_rows):
-                diag_down.append(self.board[r][c]) 
-        return diag_up, diag_down
-
-    # Below are based on:
-    # https://stackoverflow.com/questions/6313308/get-all-the-diagonals-in-a-matrix-list-of-lists-in-python
-    
+        diag_up, diag_down = self.geometry.diags_through(cross_r, cross_c)
+        return self.get_line(diag_up), self.get_line(diag_down)
+
+    # The lines of the board are precomputed per board size, see geometry.BoardGeometry
+
+    @property
+    def geometry(self):
+        """The shared geometry.BoardGeometry for this board's size."""
+        return get_geometry(self.num_rows, self.num_cols)
+
+    def get_line(self, cells):
+        """Gets the current values for a list of (row, col) cells."""
+        board = self.cells
+        n = self.num_cols
+        return [ board[r * n + c] for r, c in cells ]
+
     def get_all_rows(self):
         """Return a list of rows for the board."""
-        return [[c for c in r] for r in self.board]
+        return [ self.get_row(r) for r in range(self.num_rows) ]
 
     def get_all_cols(self):
         """Return a list of columns for the board."""
-        return list(zip(*self.board))
+        return [ self.get_col(c) for c in range(self.num_cols) ]
 
     def get_all_diags(self):
         """Return a list of all the diagonals for the board."""
-        b = [None] * (len(self.board) - 1)
-        grid_forward = [b[i:] + r + b[:i] for i, r in enumerate(self.get_all_rows())]
-        forwards = [[c for c in r if c is not None] for r in zip(*grid_forward)]
-        grid_back = [b[:i] + r + b[i:] for i, r in enumerate(self.get_all_rows())]
-        backs = [[c for c in r if c is not None] for r in zip(*grid_back)]
-        return forwards + backs
+        return [ self.get_line(diag) for diag in self.geometry.diags ]
 
     def score(self):
         """Calculate the score for each player.
         
         Players are awarded points for each streak (horizontal, vertical, or diagonal) of length 3
-        or greater equal to the square of the length (e.g., 4-in-a-row scores 16 points).        
+        or greater equal to the square of the length (e.g., 4-in-a-row scores 16 points).
+
+        The score is only computed from scratch once; successor states update it from the lines
+        through the newly placed piece (see score_delta()).
+        """
+        if self._score is None:
+            self._score = self.full_score()
+        elif GameState.verify_score:
+            full = self.full_score()
+            if full != self._score:
+                raise AssertionError("incremental score {} != full score {}\n{}".format(
+                    self._score, full, self))
+        return self._score
+
+    def full_score(self):
+        """Calculate the score by rescanning every row, column and diagonal of the board."""
+        cells = self.cells
+        return sum(line_score([ cells[i] for i in line ])
+                   for line in self.geometry.scoring_indices)
+
+    def score_bounds(self):
+        """Return the lowest and highest final score the game can still end with.
+
+        Turning any cell into one of Player 1's pieces can only lengthen or join Player 1's
+        streaks and shorten or split Player 2's, which never lowers the score.  So no way of
+        filling the empty cells scores more than filling them all with Player 1's pieces, or less
+        than filling them all with Player 2's.  Like the score, the bounds are computed from
+        scratch once and then updated by create_successor().
+
+        Returns: a (lower, upper) tuple, which is (score, score) for a full board
+        """
+        if self._bounds is None and self._bounds_move is not None:
+            # only the bound that had the new piece's cell filled by the other player changes
+            (lower, upper), row, col = self._bounds_move
+            player = self.get_cell(row, col)
+            delta = self.score_delta(row, col, -player)
+            self._bounds = (lower + delta, upper) if player == 1 else (lower, upper + delta)
+            self._bounds_move = None
+            if GameState.verify_score:
+                full = self.full_bounds()
+                if full != self._bounds:
+                    raise AssertionError("incremental bounds {} != full bounds {}\n{}".format(
+                        self._bounds, full, self))
+        if self._bounds is None:
+            self._bounds = self.full_bounds()
+        return self._bounds
+
+    def full_bounds(self):
+        """Calculate score_bounds() by rescanning the board with its empty cells filled in."""
+        if self.is_full():
+            return (self.score(), self.score())
+        high = [ val or 1 for val in self.cells ]
+        low = [ val or -1 for val in self.cells ]
+        lines = self.geometry.scoring_indices
+        return (sum(line_score([ low[i] for i in line ]) for line in lines),
+                sum(line_score([ high[i] for i in line ]) for line in lines))
+
+    def pattern_value(self, evaluator):
+        """Return evaluator.value() of the board (see patterns.PatternEvaluator).
+
+        The value is computed from scratch the first time it's asked for with an evaluator; from
+        then on create_successor() updates it for every successor, from the windows through the
+        new piece.
+        """
+        if self._patterns is None or self._patterns[0] is not evaluator:
+            self._patterns = (evaluator, evaluator.value(self.cells))
+        return self._patterns[1]
+
+    def score_delta(self, row, col, fill=0):
+        """Determine how much the piece at (row, col) changed the score.
+
+        Only the row, column and two diagonals through the cell are rescored, once with the piece
+        and once with the cell empty again.
+
+        Args:
+            fill: what to count the empty cells as, the cell at (row, col) included before the
+                move; with 1 or -1 instead of the default 0, this is how much the piece changed
+                one of the score_bounds()
         """
-        p1_score = 0
-        p2_score = 0
-        for run in self.get_all_rows() + self.get_all_cols() + self.get_all_diags():
-            for elt, length in streaks(run):
-                if (elt == 1) and (length >= 3):
-                    p1_score += length**2
-                elif (elt == -1) and (length >= 3):
-                    p2_score += length**2
-        return p1_score - p2_score
+        cells = self.cells
+        delta = 0
+        for indices, i in self.geometry.indices_through[row][col]:
+            if len(indices) < 3:
+                continue
+            if fill:
+                line = [ cells[j] or fill for j in indices ]
+            else:
+                line = [ cells[j] for j in indices ]
+            before = list(line)
+            before[i] = fill
+            delta += line_score(line) - line_score(before)
+        return delta
 
     def is_full(self):
         """Checks to see if there are available moves left."""
-        for r in range(self.num_rows):
-            for c in range(self.num_cols):
-                if self.board[r][c] == 0:
-                    return False
-        return True
+        return self._pieces == len(self.cells)
 
     def winner(self):
         s = self.score()
@@ -151,18 +390,13 @@ class GameState:
    
 
     def __str__(self):
-        symbols = { -1: "O", 1: "X", 0: "-" }
-        s = ""
-        for r in range(self.num_rows-1, -1, -1):
-            s += "\n"
-            for c in range(self.num_cols):
-                s += "  " + symbols[self.board[r][c]]
-
-        s += "\n  " + "." * (self.num_cols * 3 - 2) + "\n"
-        for c in range(self.num_cols):
-            s += "  " + str(c)
-        s += "\n"
-        return s
+        symbols = { -1: "  O", 1: "  X", 0: "  -" }
+        n = self.num_cols
+        cells = self.cells
+        rows = [ "".join([ symbols[val] for val in cells[r * n:(r + 1) * n] ])
+                 for r in range(self.num_rows-1, -1, -1) ]
+        return "\n{}\n  {}\n{}\n".format("\n".join(rows), "." * (n * 3 - 2),
+                                        "".join([ "  " + str(c) for c in range(n) ]))
 
 
 def streaks(lst):
@@ -181,25 +415,131 @@ def streaks(lst):
     return rets
 
 
-def play_game(player1, player2, state, depth=None):
+def line_score(lst):
+    """Return Player 1's points minus Player 2's points for the streaks in a single line."""
+    total = 0
+    for elt, length in streaks(lst):
+        if (elt != 0) and (length >= 3):
+            total += elt * length**2
+    return total
+
+
+agent_codes = { 'r': RandomAgent,
+                'h': HumanAgent,
+                'c': MinimaxAgent,
+                'p': PruneAgent,
+                'm': MCTSAgent }
+
+
+def make_agent(code, depth=None, tt=None, time_ms=None, workers=None, split_ply=1,
+               batch_eval=False, book=None, symmetry=False, bounds=False, ponder=False,
+               use_patterns=False, weights=None, ordering=False, **options):
+    """Create an agent from its command-line code.
+
+    Options that don't apply to the agent's class are ignored.  If a depth limit or time budget is
+    given, 'c' plays with the heuristic agent instead of exact minimax.
+
+    Args:
+        code: one of the keys of agent_codes
+        depth: the depth limit the agent will be asked to search to (None for unlimited)
+        tt: size in megabytes of a transposition table for computer agents
+        time_ms, workers, split_ply, batch_eval: see the agents' constructors
+        book: path of a solved-position book file (see book.py) for computer agents
+        symmetry: whether computer agents share results between mirror-image positions
+        bounds: whether minimax agents prune exact searches with score bounds
+        ponder: whether depth-limited agents search during the opponent's turn
+        use_patterns: whether depth-limited agents use pattern-table evaluation (see patterns.py)
+        weights: path of a weights file (see tuning.py) for depth-limited agents; pattern weights
+            in it imply use_patterns
+        ordering: whether alpha-beta agents search moves in a heuristic order
+        options: any further constructor arguments, e.g. iterations=500 for MCTSAgent
+
+    Returns: the new agent
+    """
+    agent_class = agent_codes[code]
+    if agent_class is MinimaxAgent and (depth is not None or time_ms):
+        agent_class = HeuristicAgent
+    kwargs = dict(options)
+    if tt and issubclass(agent_class, MinimaxAgent):
+        kwargs['tt'] = TranspositionTable.from_megabytes(tt)
+    if workers and issubclass(agent_class, MinimaxAgent):
+        kwargs['workers'] = workers
+        kwargs['split_ply'] = split_ply
+    if workers and agent_class is MCTSAgent:
+        kwargs['workers'] = workers
+    if time_ms and (issubclass(agent_class, HeuristicAgent) or agent_class is MCTSAgent):
+        kwargs['time_ms'] = time_ms
+    if batch_eval and issubclass(agent_class, HeuristicAgent):
+        kwargs['batch_eval'] = True
+    if book and issubclass(agent_class, MinimaxAgent):
+        kwargs['book'] = BookReader(book)
+    if symmetry and issubclass(agent_class, MinimaxAgent):
+        kwargs['symmetry'] = True
+    if bounds and issubclass(agent_class, MinimaxAgent):
+        kwargs['bounds'] = True
+    if ponder and issubclass(agent_class, HeuristicAgent):
+        kwargs['ponder'] = True
+    pattern_weights = streak_weights = None
+    if weights and issubclass(agent_class, HeuristicAgent):
+        pattern_weights, streak_weights = patterns.load_weights(weights)
+    if (use_patterns or pattern_weights) and issubclass(agent_class, HeuristicAgent):
+        kwargs['use_patterns'] = True
+        if pattern_weights:
+            kwargs['weights'] = pattern_weights
+    if streak_weights:
+        kwargs['streak_weights'] = streak_weights
+    if ordering and issubclass(agent_class, PruneAgent):
+        kwargs['ordering'] = True
+    return agent_class(**kwargs)
+
+
+def load_test_board(label):
+    """Create a GameState holding one of the boards in test_boards."""
+    board = [ list(row) for row in test_boards.boards[label] ]
+    state = GameState(len(board), len(board[0]))
+    state.board = board
+    return state
+
+
+VERBOSITY = ['full', 'summary', 'silent', 'json']
+
+
+def play_game(player1, player2, state, depth=None, verbosity='full', events=None):
     """Run a Connect383 game.
 
     Player objects can be of any class that defines a get_move(state, depth) method that returns
     a move, state tuple.
+
+    Args:
+        verbosity: 'full' prints every move and board, 'summary' only the result and statistics,
+            'silent' nothing at all, and 'json' nothing but the JSON records (see events)
+        events: file to write JSON lines records to, one per move and a final one for the result
+            (default: sys.stdout if verbosity is 'json', otherwise no records); each move's record
+            has the turn, player, move, score, states generated and elapsed milliseconds
+
+    Returns: the final score
     """
-    print(state)
+    full = verbosity == 'full'
+    if verbosity == 'json' and events is None:
+        events = sys.stdout
+    if full:
+        print(state)
 
     turn = 0
     score = 0
     p1_state_count, p2_state_count = 0, 0
-    state_count_prev = 0
+    state_count_prev = GameState.state_count
     while not state.is_full():
         player_next = player1 if state.next_player() == 1 else player2
+        start = time.perf_counter()
         move, state = player_next.get_move(state, depth)
-        print("Turn {}: Player {} moves {}".format(turn, 1 if state.next_player() == -1 else 2, move))
-        print(state)
+        elapsed = time.perf_counter() - start
         score = state.score()
-        print("Current score is:", score)
+        if full:
+            print("Turn {}: Player {} moves {}".format(
+                turn, 1 if state.next_player() == -1 else 2, move))
+            print(state)
+            print("Current score is:", score)
 
         new_states_created = GameState.state_count - state_count_prev
         if state.next_player() == -1:  # "reversed" since the state has been overwritten above!
@@ -208,9 +548,27 @@ def play_game(player1, player2, state, depth=None):
             p2_state_count += new_states_created        
         state_count_prev = GameState.state_count
 
+        if events is not None:
+            events.write(json.dumps({ 'event': 'move',
+                                      'turn': turn,
+                                      'player': 1 if state.next_player() == -1 else 2,
+                                      'move': move,
+                                      'score': score,
+                                      'states': new_states_created,
+                                      'ms': round(elapsed * 1000, 3) }) + "\n")
         turn += 1
 
     score = state.score()
+    if events is not None:
+        events.write(json.dumps({ 'event': 'end',
+                                  'score': score,
+                                  'winner': 1 if score > 0 else 2 if score < 0 else 0,
+                                  'p1_states': p1_state_count,
+                                  'p2_states': p2_state_count }) + "\n")
+        events.flush()
+    if verbosity not in ('full', 'summary'):
+        return score
+
     if score == 0:
         print("It's a tie.")
     elif score >= 1:
@@ -219,6 +577,13 @@ def play_game(player1, player2, state, depth=None):
         print("Player 2 wins! By", -score, "points")
     print("Player 1 generated {} states".format(p1_state_count))
     print("Player 2 generated {} states".format(p2_state_count))
+    for num, player in ((1, player1), (2, player2)):
+        if getattr(player, 'tt', None) is not None:
+            print("Player {} transposition table: {}".format(num, player.tt.stats()))
+        if getattr(player, 'book', None) is not None:
+            print("Player {} solved-position book: {}".format(num, player.book.stats()))
+        if getattr(player, 'ponder', False):
+            print("Player {} pondering: {}".format(num, player.ponder_stats()))
 
     return score
 
@@ -228,32 +593,89 @@ def play_game(player1, player2, state, depth=None):
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
-    parser.add_argument('p1', choices=['r','h','c','p'])
-    parser.add_argument('p2', choices=['r','h','c','p'])
+    parser.add_argument('p1', choices=agent_codes.keys())
+    parser.add_argument('p2', choices=agent_codes.keys())
     parser.add_argument('nrows', type=int)
     parser.add_argument('ncols', type=int)
     parser.add_argument('--depth', type=int, nargs=1)
     parser.add_argument('--board', choices=test_boards.boards.keys(), nargs=1)
+    parser.add_argument('--verify-score', action='store_true',
+                        help="cross-check every incremental score and score bound against a "
+                             "full rescan")
+    parser.add_argument('--tt', type=float, metavar='MB',
+                        help="give computer agents a transposition table of about this size")
+    parser.add_argument('--time-ms', type=int,
+                        help="per-move time budget; computer agents use iterative deepening")
+    parser.add_argument('--workers', type=int,
+                        help="search root moves in parallel in this many processes")
+    parser.add_argument('--split-ply', type=int, default=1,
+                        help="plies to expand before handing subtrees to the workers")
+    parser.add_argument('--batch-eval', action='store_true',
+                        help="evaluate leaves in NumPy batches (heuristic agents only)")
+    parser.add_argument('--book', metavar='FILE',
+                        help="solved-position book for computer agents to look positions up in")
+    parser.add_argument('--symmetry', action='store_true',
+                        help="treat mirror-image positions as one in exact searches")
+    parser.add_argument('--bounds', action='store_true',
+                        help="skip subtrees of exact searches that can't change the result")
+    parser.add_argument('--ordering', action='store_true',
+                        help="search moves in a heuristic order (alpha-beta agents)")
+    parser.add_argument('--ponder', action='store_true',
+                        help="keep searching on the opponent's time (depth-limited agents)")
+    parser.add_argument('--patterns', action='store_true',
+                        help="evaluate positions with pattern tables (depth-limited agents)")
+    parser.add_argument('--weights', metavar='FILE',
+                        help="evaluation weights file written by tuning.py")
+    parser.add_argument('--verbosity', choices=VERBOSITY, default='full',
+                        help="what to print: every move, the result only, nothing, or JSON lines")
+    parser.add_argument('--events', metavar='FILE',
+                        help="write a JSON lines record per move to this file")
+    parser.add_argument('--profile', nargs='?', const='table', choices=['table', 'json'],
+                        help="time the hot paths and report them after the game")
     args = parser.parse_args()
 
-    agent_codes = { 'r': RandomAgent,
-                    'h': HumanAgent,
-                    'c': MinimaxAgent,
-                    'p': PruneAgent }
+    GameState.verify_score = args.verify_score
 
-    if args.depth:  # if we gave it a depth limit, switch the the heuristic agent
-        agent_codes['c'] = HeuristicAgent
+    if args.depth:
         args.depth = args.depth[0]
 
-    play1 = agent_codes[args.p1]()
-    play2 = agent_codes[args.p2]()
+    def make_player(code):
+        return make_agent(code, depth=args.depth, tt=args.tt, time_ms=args.time_ms,
+                          workers=args.workers, split_ply=args.split_ply,
+                          batch_eval=args.batch_eval, book=args.book, symmetry=args.symmetry,
+                          bounds=args.bounds, ponder=args.ponder, use_patterns=args.patterns,
+                          weights=args.weights, ordering=args.ordering)
+
+    play1 = make_player(args.p1)
+    play2 = make_player(args.p2)
 
     if args.board:
-        board = list(test_boards.boards[args.board[0]])
-        start_state = GameState(len(board), len(board[0]))
-        start_state.board = board
+        start_state = load_test_board(args.board[0])
     else:
         start_state = GameState(args.nrows, args.ncols)
 
-    play_game(play1, play2, start_state, args.depth)
+    events = open(args.events, 'w', buffering=1 << 16) if args.events else None
+
+    def play():
+        play_game(play1, play2, start_state, args.depth, args.verbosity, events)
 
+    if not args.profile:
+        play()
+    else:
+        search_stats = {}
+        with profiling.Profiler() as profiler:
+            profiler.instrument(GameState, profiling.STATE_METHODS)
+            for num, player in ((1, play1), (2, play2)):
+                profiler.instrument(type(player), profiling.AGENT_METHODS)
+                if isinstance(player, PruneAgent):
+                    player.search_stats = search_stats["Player {}".format(num)] = \
+                        profiling.SearchStats()
+            play()
+        print()
+        print(profiling.report(profiler, search_stats, args.profile))
+
+    for player in (play1, play2):
+        if hasattr(player, 'close'):
+            player.close()
+    if events is not None:
+        events.close()
@@ -0,0 +1,72 @@
+"""Precomputed line layouts for each board size.
+
+Scoring and evaluating a board means walking every row, column and diagonal of it.  The cells
+making up those lines only depend on the board's size, so BoardGeometry works them out once per
+(nrows, ncols) and every state of that size shares the result (see get_geometry()).
+"""
+
+import functools
+
+
+class BoardGeometry:
+    """The lines of an nrows x ncols board, as lists of (row, col) cell coordinates.
+
+    Attributes:
+        rows, cols, diags: the lines in the same order as GameState.get_all_rows(),
+            get_all_cols() and get_all_diags() return them
+        lines: rows + cols + diags
+        scoring_lines: the lines long enough to hold a scoring streak (3 or more cells)
+        lines_through: lines_through[r][c] is a list of (line, position) pairs for the row,
+            column, "up" and "down" diagonal through cell (r, c), where position is the cell's
+            index within the line
+        indices, scoring_indices, indices_through: the same as lines, scoring_lines and
+            lines_through, but with each cell given as its flat index r * ncols + c, the layout
+            of GameState.cells
+    """
+
+    def __init__(self, nrows, ncols):
+        self.num_rows = nrows
+        self.num_cols = ncols
+        self.rows = [ [ (r, c) for c in range(ncols) ] for r in range(nrows) ]
+        self.cols = [ [ (r, c) for r in range(nrows) ] for c in range(ncols) ]
+
+        # "forward" diagonals run down and to the right, "back" diagonals up and to the right;
+        # both are listed starting from the bottom row's end, as get_all_diags() does
+        forwards = []
+        for k in range(nrows + ncols - 1):
+            forwards.append([ (r, k - (nrows - 1) + r) for r in range(nrows)
+                              if 0 <= k - (nrows - 1) + r < ncols ])
+        backs = []
+        for k in range(nrows + ncols - 1):
+            backs.append([ (r, k - r) for r in range(nrows) if 0 <= k - r < ncols ])
+        self.diags = forwards + backs
+
+        self.lines = self.rows + self.cols + self.diags
+        self.scoring_lines = [ line for line in self.lines if len(line) >= 3 ]
+
+        self.lines_through = [ [ [] for c in range(ncols) ] for r in range(nrows) ]
+        for line in self.rows + self.cols + self.diags:
+            for position, (r, c) in enumerate(line):
+                self.lines_through[r][c].append((line, position))
+
+        def flat(line):
+            return [ r * ncols + c for r, c in line ]
+
+        self.indices = [ flat(line) for line in self.lines ]
+        self.scoring_indices = [ flat(line) for line in self.scoring_lines ]
+        self.indices_through = [ [ [ (flat(line), position) for line, position in through ]
+                                   for through in row ] for row in self.lines_through ]
+
+    def diags_through(self, r, c):
+        """Return the "up" and "down" diagonals through a cell, as GameState.get_diags() does."""
+        up = [ (r + d, c + d)
+               for d in range(-min(r, c), min(self.num_rows - r, self.num_cols - c)) ]
+        down = [ (r - d, c + d)
+                 for d in range(-min(self.num_rows - 1 - r, c), min(r + 1, self.num_cols - c)) ]
+        return up, down
+
+
+@functools.lru_cache(maxsize=None)
+def get_geometry(nrows, ncols):
+    """Return the (shared) BoardGeometry for a board size."""
+    return BoardGeometry(nrows, ncols)
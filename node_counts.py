@@ -0,0 +1,95 @@
+"""Regression table of how many states each search agent generates on the test boards.
+
+Run this after changing a search method to compare its node counts with the recorded ones in
+node_counts.txt.  Use --update to record the current counts once a change is intended.
+
+    python node_counts.py [--update]
+"""
+
+import argparse
+import sys
+
+from agents import MinimaxAgent, PruneAgent
+from connect383 import GameState, load_test_board
+import test_boards
+
+
+TABLE_FILE = "node_counts.txt"
+
+# column label -> function creating the agent; every agent searches to full depth
+AGENTS = [ ('minimax', MinimaxAgent),
+           ('prune', PruneAgent),
+           ('prune_ordered', lambda: PruneAgent(ordering=True)) ]
+
+
+def count_nodes(agent, state, depth=None):
+    """Return how many states the agent generates choosing a move from the given state."""
+    start = GameState.state_count
+    agent.get_move(state, depth)
+    return GameState.state_count - start
+
+
+def node_count_table():
+    """Count nodes for every (non-empty) test board and agent.
+
+    Returns: a dict of board label -> dict of agent label -> node count
+    """
+    table = {}
+    for label, board in test_boards.boards.items():
+        if not board:
+            continue
+        table[label] = { name: count_nodes(make_agent(), load_test_board(label))
+                         for name, make_agent in AGENTS }
+    return table
+
+
+def format_table(table):
+    """Format a node count table as aligned text."""
+    names = [ name for name, _ in AGENTS ]
+    lines = [ "{:<20}".format("board") + "".join("{:>15}".format(n) for n in names) ]
+    for label, counts in table.items():
+        lines.append("{:<20}".format(label)
+                     + "".join("{:>15}".format(counts.get(n, "-")) for n in names))
+    return "\n".join(lines) + "\n"
+
+
+def parse_table(text):
+    """Read back a table written by format_table()."""
+    rows = text.strip().splitlines()
+    names = rows[0].split()[1:]
+    return { fields[0]: { n: int(v) for n, v in zip(names, fields[1:]) if v != "-" }
+             for fields in (row.split() for row in rows[1:]) }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--update', action='store_true', help="record the current counts")
+    args = parser.parse_args()
+
+    current = node_count_table()
+    print(format_table(current))
+
+    if args.update:
+        with open(TABLE_FILE, "w") as f:
+            f.write(format_table(current))
+        print("Recorded in", TABLE_FILE)
+        sys.exit(0)
+
+    try:
+        with open(TABLE_FILE) as f:
+            recorded = parse_table(f.read())
+    except FileNotFoundError:
+        print("No recorded counts yet; run with --update")
+        sys.exit(1)
+
+    changed = False
+    for label, counts in current.items():
+        for name, count in counts.items():
+            old = recorded.get(label, {}).get(name)
+            if old != count:
+                changed = True
+                print("{} / {}: {} -> {}".format(label, name, old, count))
+    if not changed:
+        print("Node counts match", TABLE_FILE)
+    sys.exit(1 if changed else 0)
@@ -0,0 +1,172 @@
+"""Pattern-table evaluation: scoring the short windows of every line with a precomputed table.
+
+HeuristicAgent.evaluation() walks every line of the board and only looks to the right of each
+streak.  PatternEvaluator instead cuts every line into overlapping windows of WINDOW cells (lines
+of 3 cells are a single window of 3), encodes each window's contents as a small integer with one
+base-3 digit per cell (0 empty, 1 Player 1, 2 Player 2), and looks its value up in a table built
+once per set of weights.  A window holding pieces of one player only can still become part of a
+streak, and is worth more the more pieces it holds; a window holding both players' pieces is
+dead.  Windows overlap, so a run with room on both sides, or with a gap in it, is counted by every
+window that could complete it, and a run blocked on both sides by none.
+
+A piece only changes the windows through its own cell, so GameState keeps the value up to date
+move by move (see GameState.pattern_value()), and evaluating a leaf costs a table lookup per
+window through its last piece instead of a scan of the whole board.
+
+The weights default to DEFAULT_WEIGHTS; tuning.py fits better ones by self-play and writes them
+to a weights file, which load_weights() reads back.  A weights file can also hold the weights of
+the streak terms of HeuristicAgent.evaluation() without pattern evaluation (STREAK_WEIGHT_NAMES),
+which tuning.py fits the same way.
+"""
+
+import json
+
+from geometry import get_geometry
+
+
+WINDOW = 4  # cells per window, on lines at least this long (delta() relies on it being 4)
+
+# weight of a window of each (length, number of pieces) holding one player's pieces only
+WEIGHT_NAMES = [ (3, 1), (3, 2), (4, 1), (4, 2), (4, 3) ]
+DEFAULT_WEIGHTS = (1, 4, 1, 3, 8)
+
+# weights of the streak evaluation (HeuristicAgent.evaluation() without patterns): per streak of
+# 2, per piece of a streak followed by an empty cell, and per length**2 of a streak of 3 or more
+STREAK_WEIGHT_NAMES = [ 'pair', 'open', 'run' ]
+DEFAULT_STREAK_WEIGHTS = (5, 5, 1)
+
+BASES = { 4: 0, 3: 3 ** 4 }  # offset of each window length's codes in the table
+POWERS = [ 3 ** j for j in range(WINDOW) ]
+
+_evaluators = {}  # (nrows, ncols, weights) -> PatternEvaluator
+
+
+def pattern_table(weights):
+    """Build the table of window values for a set of weights (see WEIGHT_NAMES).
+
+    Entry BASES[length] + code is the value of a window of that length whose cells, read as
+    base-3 digits from the first cell up, make up code: positive for Player 1, negative for
+    Player 2.  The value only depends on how many pieces the window holds, so a window and its
+    reverse are worth the same and the evaluation is the same for a board and its mirror image.
+    """
+    weight = dict(zip(WEIGHT_NAMES, weights))
+    table = [0] * (BASES[3] + 3 ** 3)
+    for length, base in BASES.items():
+        for code in range(3 ** length):
+            digits = [ code // POWERS[j] % 3 for j in range(length) ]
+            p1, p2 = digits.count(1), digits.count(2)
+            if p1 and not p2:
+                table[base + code] = weight.get((length, p1), 0)
+            elif p2 and not p1:
+                table[base + code] = -weight.get((length, p2), 0)
+    return table
+
+
+class PatternEvaluator:
+    """Pattern-table evaluation of the boards of one size, for one set of weights.
+
+    Attributes:
+        table: see pattern_table()
+        windows: (table base, flat cell indices) for every window of the board
+        through: through[i] is a pair of lists of (flat cell indices, power of 3 of cell i) for
+            the windows of length 4 and of length 3 through flat cell i
+    """
+
+    def __init__(self, nrows, ncols, weights=DEFAULT_WEIGHTS):
+        self.num_rows = nrows
+        self.num_cols = ncols
+        self.weights = tuple(weights)
+        self.table = pattern_table(self.weights)
+        self.windows = []
+        for line in get_geometry(nrows, ncols).scoring_indices:
+            length = min(WINDOW, len(line))
+            for start in range(len(line) - length + 1):
+                self.windows.append((BASES[length], tuple(line[start:start + length])))
+        self.through = [ ([], []) for _ in range(nrows * ncols) ]
+        for _, indices in self.windows:
+            for j, i in enumerate(indices):
+                self.through[i][len(indices) == 3].append((indices, POWERS[j]))
+
+    def __reduce__(self):
+        # unpickle through get_evaluator(), so each process keeps one evaluator per size and
+        # weights, and states sent to worker processes still share it
+        return get_evaluator, (self.num_rows, self.num_cols, self.weights)
+
+    def value(self, cells):
+        """Total the values of every window of a board, given as flat cells (GameState.cells)."""
+        table = self.table
+        total = 0
+        for base, indices in self.windows:
+            code = base
+            for i, power in zip(indices, POWERS):
+                code += cells[i] % 3 * power
+            total += table[code]
+        return total
+
+    def delta(self, cells, i):
+        """Return how much the piece at flat index i changed value(cells).
+
+        This runs for every successor state, so the codes are spelled out for each window length.
+        """
+        table = self.table
+        digit = cells[i] % 3
+        fours, threes = self.through[i]
+        base3 = BASES[3]
+        total = 0
+        for (a, b, c, d), power in fours:
+            code = cells[a] % 3 + 3 * (cells[b] % 3) + 9 * (cells[c] % 3) + 27 * (cells[d] % 3)
+            total += table[code] - table[code - digit * power]
+        for (a, b, c), power in threes:
+            code = base3 + cells[a] % 3 + 3 * (cells[b] % 3) + 9 * (cells[c] % 3)
+            total += table[code] - table[code - digit * power]
+        return total
+
+
+def save_weights(path, weights=None, streak_weights=None, **info):
+    """Write a weights file: a JSON document with the weights by name, plus any extra info.
+
+    Either set of weights may be left out.  The weights are stored as whole numbers, like the
+    points of score(), so evaluations stay exact integers however they are added up.
+    """
+    document = {}
+    if weights is not None:
+        document['weights'] = { "{},{}".format(*name): int(round(w))
+                                for name, w in zip(WEIGHT_NAMES, weights) }
+    if streak_weights is not None:
+        document['streak_weights'] = { name: int(round(w))
+                                       for name, w in zip(STREAK_WEIGHT_NAMES, streak_weights) }
+    document['info'] = info
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=1)
+
+
+def load_weights(path):
+    """Read a weights file written by save_weights().
+
+    Weights missing from a set keep their default value.
+
+    Returns: (pattern weights, streak weights), each a tuple, or None if the file doesn't have
+        that set
+    """
+    with open(path) as f:
+        document = json.load(f)
+    weights = streak_weights = None
+    if 'weights' in document:
+        named = document['weights']
+        weights = tuple(named.get("{},{}".format(*name), default)
+                        for name, default in zip(WEIGHT_NAMES, DEFAULT_WEIGHTS))
+    if 'streak_weights' in document:
+        named = document['streak_weights']
+        streak_weights = tuple(named.get(name, default)
+                               for name, default in zip(STREAK_WEIGHT_NAMES,
+                                                        DEFAULT_STREAK_WEIGHTS))
+    return weights, streak_weights
+
+
+def get_evaluator(nrows, ncols, weights=DEFAULT_WEIGHTS):
+    """Return the (shared) PatternEvaluator for a board size and weights."""
+    key = (nrows, ncols, tuple(weights))
+    evaluator = _evaluators.get(key)
+    if evaluator is None:
+        evaluator = _evaluators[key] = PatternEvaluator(nrows, ncols, weights)
+    return evaluator
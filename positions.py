@@ -0,0 +1,350 @@
+"""Position files: compact binary and text encodings of many game states, read back lazily.
+
+Benchmarks and solving work want thousands or millions of positions, far more than can be
+written by hand in test_boards.py.  This module stores them in files and streams them back one
+GameState at a time, or as NumPy batches for vectorized.BatchEvaluator, without loading a whole
+file into memory.
+
+Binary files (any extension but .txt) hold one board size.  Layout (little-endian):
+    header:  magic b"C383POSN", version (uint16), nrows (uint8), ncols (uint8), padding (uint32)
+    records: one per position, record_size(nrows, ncols) bytes each, until the end of the file
+
+A record is book.position_key() of the position: (nrows + 1) bits per column, one for each of
+Player 1's pieces plus a marker bit just above the column's top piece, so a column's height is
+the position of its highest set bit.  A 6x7 position takes 7 bytes.  Only positions that obey
+gravity (no gaps under a piece) can be stored this way.
+
+Text files (.txt) have one position per line, top row first, rows separated by "/": X for
+Player 1, O for Player 2 and a number for a run of empty cells, e.g. "3/1X1/XXO" for a 3x3 board.
+Any board can be written this way, boards of different sizes can share a file, and blank lines
+and lines starting with # are skipped.
+
+    python positions.py random 6x7 --count 1000000 --out mid_6x7.pos
+    python positions.py test-boards --out test_boards.txt
+    python positions.py convert mid_6x7.pos mid_6x7.txt
+    python positions.py info mid_6x7.pos
+"""
+
+import argparse
+import os
+import random
+import struct
+
+from bitboard import BitboardState
+from book import position_key, bitboard_key
+from connect383 import GameState, load_test_board
+from vectorized import stack_boards
+import test_boards
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, only read_batches() needs it
+    np = None
+
+
+MAGIC = b"C383POSN"
+VERSION = 1
+HEADER = struct.Struct("<8sHBBI")
+CHUNK = 4096  # number of records read from a binary file at a time
+
+SYMBOLS = { 1: "X", -1: "O" }
+VALUES = { "X": 1, "O": -1 }
+
+
+def record_size(nrows, ncols):
+    """Return the number of bytes a binary record takes for a board size."""
+    return ((nrows + 1) * ncols + 7) // 8
+
+
+def pack_position(state):
+    """Return the binary record of a GameState or BitboardState, as bytes.
+
+    Raises ValueError for boards with gaps, which have no record.
+    """
+    if isinstance(state, BitboardState):
+        key = bitboard_key(state)
+    else:
+        key = position_key(state)
+        if key is None:
+            raise ValueError("only positions that obey gravity can be stored in binary files")
+    return key.to_bytes(record_size(state.num_rows, state.num_cols), 'little')
+
+
+def unpack_position(record, nrows, ncols):
+    """Build a GameState from a binary record (see pack_position())."""
+    key = int.from_bytes(record, 'little')
+    col_bits = nrows + 1
+    mask = (1 << col_bits) - 1
+    rows = [ [0] * ncols for _ in range(nrows) ]
+    for c in range(ncols):
+        bits = (key >> (c * col_bits)) & mask
+        height = bits.bit_length() - 1  # the marker bit sits just above the top piece
+        if height < 0:
+            raise ValueError("record for column {} has no height marker".format(c))
+        for r in range(height):
+            rows[r][c] = 1 if (bits >> r) & 1 else -1
+    state = GameState(nrows, ncols)
+    state.board = rows
+    return state
+
+
+def format_position(state):
+    """Return the text encoding of a GameState or BitboardState (see the module docstring)."""
+    rows = []
+    for r in range(state.num_rows - 1, -1, -1):
+        row = ""
+        empty = 0
+        for c in range(state.num_cols):
+            val = state.get_cell(r, c)
+            if val == 0:
+                empty += 1
+                continue
+            if empty:
+                row += str(empty)
+                empty = 0
+            row += SYMBOLS[val]
+        rows.append(row + str(empty) if empty else row)
+    return "/".join(rows)
+
+
+def parse_position(text):
+    """Build a GameState from its text encoding (see format_position()).
+
+    Raises ValueError if the text isn't a valid position.
+    """
+    rows = []
+    for row_text in text.strip().split("/"):
+        row = []
+        digits = ""
+        for ch in row_text:
+            if ch.isdigit():
+                digits += ch
+                continue
+            if digits:
+                row.extend([0] * int(digits))
+                digits = ""
+            if ch.upper() not in VALUES:
+                raise ValueError("unexpected {!r} in position {!r}".format(ch, text))
+            row.append(VALUES[ch.upper()])
+        if digits:
+            row.extend([0] * int(digits))
+        rows.append(row)
+    if not rows[0] or any(len(row) != len(rows[0]) for row in rows):
+        raise ValueError("rows of position {!r} differ in length".format(text))
+    state = GameState(len(rows), len(rows[0]))
+    state.board = rows[::-1]
+    return state
+
+
+class PositionWriter:
+    """Writes positions to a binary or text position file, one at a time.
+
+    Binary files must be opened in binary mode and text files in text mode.  The binary header is
+    written with the first position, and every later position must have the same board size.
+    """
+
+    def __init__(self, f, fmt='binary'):
+        self.f = f
+        self.fmt = fmt
+        self.size = None  # (nrows, ncols) of a binary file, once its header is written
+        self.count = 0
+
+    def write(self, state):
+        """Append a GameState or BitboardState to the file."""
+        if self.fmt == 'text':
+            self.f.write(format_position(state) + "\n")
+        else:
+            size = (state.num_rows, state.num_cols)
+            if self.size is None:
+                self.f.write(HEADER.pack(MAGIC, VERSION, size[0], size[1], 0))
+                self.size = size
+            elif size != self.size:
+                raise ValueError("a {}x{} position can't go in a {}x{} position file".format(
+                    size[0], size[1], self.size[0], self.size[1]))
+            self.f.write(pack_position(state))
+        self.count += 1
+
+
+def file_format(path):
+    """Return the format of a position file from its name: 'text' for .txt, else 'binary'."""
+    return 'text' if path.endswith('.txt') else 'binary'
+
+
+def write_positions(path, states, fmt=None):
+    """Write an iterable of states to a position file.
+
+    Args:
+        path: the file to write
+        states: GameStates or BitboardStates, consumed one at a time
+        fmt: 'binary' or 'text' (default: from the file name, see file_format())
+
+    Returns: the number of positions written
+    """
+    fmt = fmt or file_format(path)
+    with open(path, 'w' if fmt == 'text' else 'wb') as f:
+        writer = PositionWriter(f, fmt)
+        for state in states:
+            writer.write(state)
+    return writer.count
+
+
+def read_header(f):
+    """Read a binary position file's header, returning its board size as (nrows, ncols)."""
+    data = f.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError("{} is not a position file".format(f.name))
+    magic, version, nrows, ncols, _ = HEADER.unpack(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("{} is not a version {} position file".format(f.name, VERSION))
+    return nrows, ncols
+
+
+def is_binary(path):
+    """Check whether a file starts like a binary position file."""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_records(f, nrows, ncols):
+    """Yield the raw records of a binary position file, CHUNK at a time, as bytes objects."""
+    size = record_size(nrows, ncols)
+    while True:
+        data = f.read(size * CHUNK)
+        if not data:
+            return
+        if len(data) % size:
+            raise ValueError("{} ends with a partial record".format(f.name))
+        yield data
+
+
+def read_positions(path):
+    """Yield the positions in a binary or text position file as GameStates, one at a time.
+
+    Writing no positions leaves an empty file, which reads back as a text file with no lines.
+    """
+    if is_binary(path):
+        with open(path, 'rb') as f:
+            nrows, ncols = read_header(f)
+            step = record_size(nrows, ncols)
+            for data in read_records(f, nrows, ncols):
+                for i in range(0, len(data), step):
+                    yield unpack_position(data[i:i + step], nrows, ncols)
+    else:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield parse_position(line)
+
+
+def unpack_batch(data, nrows, ncols):
+    """Decode a run of binary records into an (n, nrows, ncols) int8 array of boards at once."""
+    col_bits = nrows + 1
+    records = np.frombuffer(data, dtype=np.uint8).reshape(-1, record_size(nrows, ncols))
+    bits = np.unpackbits(records, axis=1, bitorder='little')[:, :col_bits * ncols]
+    bits = bits.reshape(len(records), ncols, col_bits)
+    if not bits.any(axis=2).all():
+        raise ValueError("record with a column that has no height marker")
+    heights = col_bits - 1 - np.argmax(bits[:, :, ::-1], axis=2)  # highest set bit per column
+    filled = np.arange(nrows) < heights[:, :, None]
+    boards = np.where(filled, np.where(bits[:, :, :nrows] == 1, 1, -1), 0).astype(np.int8)
+    return boards.transpose(0, 2, 1)  # (n, ncols, nrows) -> (n, nrows, ncols)
+
+
+def read_batches(path, batch_size=CHUNK):
+    """Yield the positions in a position file as NumPy arrays of boards.
+
+    Each batch is an (n, nrows, ncols) int8 array, laid out like vectorized.stack_boards(), with
+    n = batch_size except perhaps for the last batch.  Binary records are decoded without making
+    any GameStates.  All the positions must have the same board size.
+    """
+    if np is None:
+        raise ImportError("read_batches requires NumPy")
+    if is_binary(path):
+        with open(path, 'rb') as f:
+            nrows, ncols = read_header(f)
+            size = record_size(nrows, ncols)
+            pending = bytearray()
+            for data in read_records(f, nrows, ncols):
+                pending += data
+                while len(pending) >= size * batch_size:
+                    yield unpack_batch(bytes(pending[:size * batch_size]), nrows, ncols)
+                    del pending[:size * batch_size]
+            if pending:
+                yield unpack_batch(bytes(pending), nrows, ncols)
+        return
+
+    batch = []
+    for state in read_positions(path):
+        if batch and (state.num_rows, state.num_cols) != (batch[0].num_rows, batch[0].num_cols):
+            raise ValueError("positions in {} differ in board size".format(path))
+        batch.append(state)
+        if len(batch) == batch_size:
+            yield stack_boards(batch)
+            batch = []
+    if batch:
+        yield stack_boards(batch)
+
+
+def count_positions(path):
+    """Count the positions in a position file; binary files are counted from their size."""
+    if not is_binary(path):
+        return sum(1 for _ in read_positions(path))
+    with open(path, 'rb') as f:
+        nrows, ncols = read_header(f)
+    return (os.path.getsize(path) - HEADER.size) // record_size(nrows, ncols)
+
+
+def random_positions(nrows, ncols, count, seed=0):
+    """Generate midgame positions by playing random moves from empty boards.
+
+    Like benchmark.midgame_positions(), each position is a third to two thirds of the way through
+    its game and the same seed always gives the same positions, but the moves are played on
+    bitboards so millions of positions can be generated quickly.
+
+    Returns: an iterator over BitboardStates
+    """
+    rng = random.Random(seed)
+    cells = nrows * ncols
+    for _ in range(count):
+        bb = BitboardState(nrows, ncols)
+        for _ in range(rng.randint(cells // 3, 2 * cells // 3)):
+            bb.play(rng.choice(bb.legal_moves()))
+        yield bb
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    random_parser = commands.add_parser('random', help="generate random midgame positions")
+    random_parser.add_argument('size', metavar='ROWSxCOLS')
+    random_parser.add_argument('--count', type=int, default=1000)
+    random_parser.add_argument('--seed', type=int, default=0)
+    random_parser.add_argument('--out', required=True)
+    boards_parser = commands.add_parser('test-boards', help="write out the test_boards positions")
+    boards_parser.add_argument('--out', required=True)
+    convert_parser = commands.add_parser('convert', help="convert between binary and text")
+    convert_parser.add_argument('infile')
+    convert_parser.add_argument('outfile')
+    info_parser = commands.add_parser('info', help="count the positions in a file")
+    info_parser.add_argument('file')
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        fmt = 'binary' if is_binary(args.file) else 'text'
+        print("{} positions in {} format".format(count_positions(args.file), fmt))
+    else:
+        if args.command == 'random':
+            nrows, ncols = (int(n) for n in args.size.split('x'))
+            out, states = args.out, random_positions(nrows, ncols, args.count, args.seed)
+        elif args.command == 'test-boards':
+            out, states = args.out, (load_test_board(label)
+                                     for label, board in test_boards.boards.items() if board)
+        else:
+            out, states = args.outfile, read_positions(args.infile)
+        try:
+            print("Wrote {} positions to {}".format(write_positions(out, states), out))
+        except ValueError as e:
+            parser.error(str(e))
@@ -0,0 +1,160 @@
+"""Opt-in instrumentation of the game's and agents' hot paths.
+
+GameState.state_count says how many states a search built, but not where its time went.  A
+Profiler wraps chosen methods of chosen classes with counting and timing wrappers for as long as
+it is installed, and puts the original methods back afterwards, so nothing is slowed down when
+profiling is off.  SearchStats collects per-ply node counts, branching factors and cutoff rates
+from a PruneAgent's search (see MinimaxAgent.search_stats).
+
+    python connect383.py p p 6 7 --depth 4 --profile          # summary table after the game
+    python connect383.py p p 6 7 --depth 4 --profile json
+
+Only the current process is measured: searches run by worker processes (--workers) are not.
+"""
+
+import functools
+import json
+import time
+
+
+# method names worth measuring on the game state and agent classes
+STATE_METHODS = ['create_successor', 'score', 'is_full', 'next_player']
+AGENT_METHODS = ['evaluation', 'minimax', 'minimax_depth', 'minimax_prune']
+
+
+class Profiler:
+    """Counts the calls to a set of methods and the time spent in them.
+
+    The time of a recursive method is only measured at its outermost call, so it is the total
+    time spent inside the method, including everything it called, without counting any of it
+    twice.
+    """
+
+    def __init__(self):
+        self.calls = {}  # "Class.method" -> number of calls
+        self.seconds = {}  # "Class.method" -> total time spent inside the method
+        self._originals = []  # (class, name, original function) for each wrapped method
+
+    def instrument(self, cls, names):
+        """Wrap the named methods of a class.
+
+        A method inherited from a base class is wrapped where it is defined, so it is measured
+        for every class that shares it; names the class doesn't have are skipped.
+        """
+        for name in names:
+            owner = next((base for base in cls.__mro__ if name in base.__dict__), None)
+            if owner is None or any(o == owner and n == name for o, n, _ in self._originals):
+                continue
+            original = owner.__dict__[name]
+            self._originals.append((owner, name, original))
+            setattr(owner, name, self._wrap("{}.{}".format(owner.__name__, name), original))
+
+    def _wrap(self, label, func):
+        calls = self.calls
+        seconds = self.seconds
+        calls[label] = 0
+        seconds[label] = 0.0
+        active = [False]  # whether an outer call of the method is already being timed
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            calls[label] += 1
+            if active[0]:
+                return func(*args, **kwargs)
+            active[0] = True
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds[label] += time.perf_counter() - start
+                active[0] = False
+        return timed
+
+    def uninstall(self):
+        """Put every wrapped method back the way it was."""
+        for owner, name, original in reversed(self._originals):
+            setattr(owner, name, original)
+        self._originals = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
+
+    def results(self):
+        """Return the measurements as a dict of "Class.method" -> {calls, seconds, us_per_call}."""
+        return { label: { 'calls': self.calls[label],
+                          'seconds': round(self.seconds[label], 6),
+                          'us_per_call': (round(self.seconds[label] / self.calls[label] * 1e6, 3)
+                                          if self.calls[label] else None) }
+                 for label in self.calls }
+
+
+class SearchStats:
+    """Per-ply counts of the nodes an alpha-beta search expanded.
+
+    Ply 0 is the root.  The children searched at one ply are the nodes visited at the next, so
+    the branching factor is children / nodes, and the cutoff rate is the fraction of expanded
+    nodes whose search stopped early on an alpha-beta cutoff.
+    """
+
+    def __init__(self):
+        self.nodes = {}  # ply -> number of nodes expanded
+        self.children = {}  # ply -> number of children searched from those nodes
+        self.cutoffs = {}  # ply -> number of those nodes that stopped at a cutoff
+
+    def record(self, ply, children, cutoff):
+        """Count one expanded node, the number of its children searched, and whether it cut off."""
+        self.nodes[ply] = self.nodes.get(ply, 0) + 1
+        self.children[ply] = self.children.get(ply, 0) + children
+        if cutoff:
+            self.cutoffs[ply] = self.cutoffs.get(ply, 0) + 1
+
+    def results(self):
+        """Return a list of per-ply dicts: ply, nodes, children, branching, cutoffs, cutoff_rate."""
+        rows = []
+        for ply in sorted(self.nodes):
+            nodes = self.nodes[ply]
+            cutoffs = self.cutoffs.get(ply, 0)
+            rows.append({ 'ply': ply,
+                          'nodes': nodes,
+                          'children': self.children[ply],
+                          'branching': round(self.children[ply] / nodes, 3),
+                          'cutoffs': cutoffs,
+                          'cutoff_rate': round(cutoffs / nodes, 3) })
+        return rows
+
+
+def report(profiler, search_stats, fmt='table'):
+    """Format a profiler's measurements and any search statistics.
+
+    Args:
+        profiler: the Profiler to report on
+        search_stats: a dict of label (e.g. "Player 1") -> SearchStats
+        fmt: 'table' for aligned text or 'json' for a JSON document
+
+    Returns: the report as a string
+    """
+    functions = profiler.results()
+    searches = { label: stats.results() for label, stats in search_stats.items() }
+    if fmt == 'json':
+        return json.dumps({ 'functions': functions, 'search': searches }, indent=1)
+
+    lines = [ "{:<32}{:>12}{:>12}{:>14}".format("function", "calls", "seconds", "us/call") ]
+    for label, r in sorted(functions.items(), key=lambda item: -item[1]['seconds']):
+        if r['calls']:
+            lines.append("{:<32}{:>12}{:>12.4f}{:>14}".format(
+                label, r['calls'], r['seconds'], r['us_per_call']))
+    for label, rows in searches.items():
+        if not rows:
+            continue
+        lines.append("")
+        lines.append("{} search".format(label))
+        lines.append("{:>6}{:>12}{:>12}{:>12}{:>12}{:>12}".format(
+            "ply", "nodes", "children", "branching", "cutoffs", "cutoff %"))
+        for row in rows:
+            lines.append("{:>6}{:>12}{:>12}{:>12.2f}{:>12}{:>12.1f}".format(
+                row['ply'], row['nodes'], row['children'], row['branching'], row['cutoffs'],
+                row['cutoff_rate'] * 100))
+    return "\n".join(lines)
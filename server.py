@@ -0,0 +1,436 @@
+"""Asyncio match server for human-versus-computer Connect383 games.
+
+One process hosts many games at once.  Clients send JSON requests, one per line, over a local TCP
+socket or stdin, and get one JSON response line back for each.  The computer's moves are searched
+in a shared set of worker processes, so a slow search only holds up the game it belongs to.
+
+    python server.py --port 3830 --workers 4 --move-timeout 5 --human-timeout 300
+    python server.py --stdin
+
+Requests (an optional "id" field is copied into the response, to match them up):
+    {"cmd": "new", "bot": "p:ordering", "size": "6x7", "depth": 4, "human": 1}
+        start a game against the agent spec "bot" (see tournament.parse_spec()); "human" is the
+        player the client plays, 1 (moves first, the default) or 2.  Minimax bots ('c' and 'p')
+        need a depth limit or a time_ms option, since an unlimited search may never finish
+    {"cmd": "move", "game": 3, "col": 2}
+        play a move; the response comes after the computer has replied to it
+    {"cmd": "show", "game": 3}          the game as it stands
+    {"cmd": "resign", "game": 3}        end a game early
+    {"cmd": "stats"}                    queueing and timing metrics of the server
+
+Game responses hold the game's id, board (rows from the bottom up), moves so far, score, the
+player to move next and, once it is over, the result: "finished", "resigned", "timeout" or
+"error".  If the computer's move takes longer than the move timeout, counting the wait for a free
+worker, it plays a random move instead, and a worker still searching is replaced by a fresh one.
+A human who doesn't move within the human timeout loses the game by timeout.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from connect383 import GameState, agent_codes, make_agent
+from tournament import parse_spec
+
+
+MAX_SIZE = 16  # largest number of rows or columns a game can have
+
+_worker_agents = {}  # (agent spec, depth) -> agent, for each worker process
+
+
+def _search_move(spec, depth, state):
+    """Choose the computer's move in a worker process.
+
+    Agents are created once per spec and kept, so their transposition tables outlive one move.
+
+    Returns: (move, seconds the search took)
+    """
+    agent = _worker_agents.get((spec, depth))
+    if agent is None:
+        code, options = parse_spec(spec)
+        agent = _worker_agents[(spec, depth)] = make_agent(code, depth=depth, **options)
+    start = time.perf_counter()
+    move, _ = agent.get_move(state, depth)
+    return move, time.perf_counter() - start
+
+
+class RequestError(Exception):
+    """Raised for a request the server can't carry out; its message goes back to the client."""
+
+
+class Game:
+    """One game between a client and a computer agent."""
+
+    def __init__(self, game_id, bot, state, depth, human):
+        self.id = game_id
+        self.bot = bot  # agent spec of the computer player
+        self.state = state
+        self.depth = depth
+        self.human = human  # 1 if the client is Player 1, -1 if Player 2
+        self.moves = []
+        self.result = None  # set once the game is over
+        self.deadline = None  # loop time by which the human has to move
+        self.lock = asyncio.Lock()  # one move at a time
+
+    def to_dict(self):
+        """The game as it stands, for a response."""
+        return { 'game': self.id,
+                 'bot': self.bot,
+                 'board': self.state.board,
+                 'moves': self.moves,
+                 'score': self.state.score(),
+                 'next': 1 if self.state.next_player() == 1 else 2,
+                 'result': self.result }
+
+
+class Metrics:
+    """Running counts and timings of the computer's searches."""
+
+    def __init__(self):
+        self.queued = 0  # searches waiting for a free worker
+        self.running = 0  # searches being run by a worker
+        self.searches = 0  # searches finished, or abandoned at the move timeout
+        self.timeouts = 0  # moves that ran past the move timeout, waiting or searching
+        self.max_queued = 0
+        self.queue_wait = []  # seconds each search waited for a worker
+        self.search_time = []  # seconds each search took
+
+    def to_dict(self):
+        def summary(times):
+            if not times:
+                return { 'mean': None, 'max': None }
+            return { 'mean': round(sum(times) / len(times) * 1000, 3),
+                     'max': round(max(times) * 1000, 3) }
+        return { 'queued': self.queued,
+                 'running': self.running,
+                 'max_queued': self.max_queued,
+                 'searches': self.searches,
+                 'timeouts': self.timeouts,
+                 'queue_wait_ms': summary(self.queue_wait),
+                 'search_ms': summary(self.search_time) }
+
+
+class MatchServer:
+    """Hosts any number of games, sharing a set of search processes between them.
+
+    Each search process is a single-worker ProcessPoolExecutor, handed to one search at a time
+    through a queue of idle workers.  A worker can't be interrupted, so one whose search runs
+    past the move timeout is terminated and replaced, instead of holding up the other games.
+    """
+
+    def __init__(self, workers=None, move_timeout=None, human_timeout=None, max_games=None):
+        """Constructor for a match server.
+
+        Args:
+            workers: number of search processes (default: one per CPU)
+            move_timeout: seconds a computer move may take before a random move is played
+            human_timeout: seconds a human may take to move before losing the game
+            max_games: most games that can be in progress at once
+        """
+        workers = workers or os.cpu_count() or 1
+        self.workers = [ ProcessPoolExecutor(1) for _ in range(workers) ]
+        self.idle = asyncio.Queue()  # workers free to take a search
+        for worker in self.workers:
+            self.idle.put_nowait(worker)
+        self.move_timeout = move_timeout
+        self.human_timeout = human_timeout
+        self.max_games = max_games
+        self.games = {}  # game id -> Game, for the games in progress
+        self.starting = 0  # games being set up, counted against max_games too
+        self.next_id = 1
+        self.finished = 0
+        self.metrics = Metrics()
+
+    def close(self):
+        for worker in self.workers:
+            worker.shutdown(wait=False)
+
+    def replace_worker(self, worker):
+        """Terminate a worker that is still busy with an abandoned search and start a new one."""
+        for process in list(getattr(worker, '_processes', {}).values()):
+            process.terminate()  # executors have no public way to stop a running task
+        worker.shutdown(wait=False)
+        self.workers.remove(worker)
+        fresh = ProcessPoolExecutor(1)
+        self.workers.append(fresh)
+        self.idle.put_nowait(fresh)
+
+    async def handle(self, request):
+        """Carry out one request and return its response dict."""
+        try:
+            if not isinstance(request, dict):
+                raise RequestError("requests must be JSON objects")
+            handler = { 'new': self.new_game,
+                        'move': self.human_move,
+                        'show': self.show,
+                        'resign': self.resign,
+                        'stats': self.stats }.get(request.get('cmd'))
+            if handler is None:
+                raise RequestError("unknown command {!r}".format(request.get('cmd')))
+            response = await handler(request)
+        except RequestError as e:
+            response = { 'error': str(e) }
+        except Exception as e:  # a bug shouldn't leave the client without an answer
+            response = { 'error': "internal error: {!r}".format(e) }
+        if isinstance(request, dict) and 'id' in request:
+            response['id'] = request['id']
+        return response
+
+    def get_game(self, request):
+        game = self.games.get(request.get('game'))
+        if game is None:
+            raise RequestError("no game {!r} in progress".format(request.get('game')))
+        return game
+
+    async def new_game(self, request):
+        if (self.max_games is not None
+                and len(self.games) + self.starting >= self.max_games):
+            raise RequestError("server is full ({} games)".format(self.max_games))
+        bot = request.get('bot', 'p')
+        if not isinstance(bot, str):
+            raise RequestError("bot must be an agent spec string")
+        code, options = parse_spec(bot)
+        if code not in agent_codes or code == 'h':
+            raise RequestError("bot must be a computer agent spec")
+        size = request.get('size', '6x7')
+        try:
+            nrows, ncols = (int(n) for n in size.split('x'))
+        except (ValueError, AttributeError):
+            raise RequestError("size must look like '6x7'")
+        if not (0 < nrows <= MAX_SIZE and 0 < ncols <= MAX_SIZE):
+            raise RequestError("size must be between 1x1 and {0}x{0}".format(MAX_SIZE))
+        depth = request.get('depth')
+        if depth is not None and (not isinstance(depth, int) or isinstance(depth, bool)
+                                  or depth < 0):
+            raise RequestError("depth must be a whole number >= 0, or null for no limit")
+        if code in ('c', 'p') and depth is None and not options.get('time_ms'):
+            raise RequestError("minimax bots need a depth or a time_ms option")
+        try:  # catch bad options now rather than in a worker, mid-game
+            agent = make_agent(code, depth=depth, **options)
+        except (TypeError, ValueError, OSError) as e:
+            raise RequestError("bad bot spec {!r}: {}".format(bot, e))
+        if hasattr(agent, 'close'):
+            agent.close()
+        human = request.get('human', 1)
+        if human not in (1, 2):
+            raise RequestError("human must be 1 or 2")
+
+        # the game is only registered once it is set up, so a failed start leaves nothing behind
+        game = Game(self.next_id, bot, GameState(nrows, ncols), depth, 1 if human == 1 else -1)
+        self.next_id += 1
+        self.starting += 1
+        try:
+            async with game.lock:
+                if game.human == -1:
+                    await self.bot_move(game)
+                self.wait_for_human(game)
+        finally:
+            self.starting -= 1
+        if game.result is None:
+            self.games[game.id] = game
+        else:
+            self.finished += 1  # a 1x1 board is over after the computer's first move
+        return game.to_dict()
+
+    async def human_move(self, request):
+        game = self.get_game(request)
+        async with game.lock:
+            if game.result is not None:
+                raise RequestError("game {} is over".format(game.id))
+            col = request.get('col')
+            if (not isinstance(col, int) or isinstance(col, bool)
+                    or col not in game.state.legal_moves()):
+                raise RequestError("{!r} is not a legal move".format(col))
+            self.play(game, col)
+            if game.result is None:
+                await self.bot_move(game)
+            self.wait_for_human(game)
+        return game.to_dict()
+
+    async def show(self, request):
+        return self.get_game(request).to_dict()
+
+    async def resign(self, request):
+        game = self.get_game(request)
+        self.end(game, 'resigned')
+        return game.to_dict()
+
+    async def stats(self, request):
+        return dict(self.metrics.to_dict(), games=len(self.games), finished=self.finished)
+
+    async def bot_move(self, game):
+        """Search for the computer's move on an idle worker and play it.
+
+        The move timeout covers both the wait for a worker and the search itself.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if self.move_timeout is None else loop.time() + self.move_timeout
+
+        def time_left():
+            return None if deadline is None else max(0.0, deadline - loop.time())
+
+        metrics = self.metrics
+        metrics.queued += 1
+        metrics.max_queued = max(metrics.max_queued, metrics.queued)
+        queued_at = time.perf_counter()
+        try:
+            worker = await asyncio.wait_for(self.idle.get(), time_left())
+        except asyncio.TimeoutError:
+            worker = None
+        finally:
+            metrics.queued -= 1
+        metrics.queue_wait.append(time.perf_counter() - queued_at)
+
+        if worker is None:
+            metrics.timeouts += 1
+            move = random.choice(game.state.legal_moves())
+        else:
+            metrics.running += 1
+            search = loop.run_in_executor(worker, _search_move, game.bot, game.depth,
+                                          game.state)
+            try:
+                move, seconds = await asyncio.wait_for(search, time_left())
+                metrics.search_time.append(seconds)
+                self.idle.put_nowait(worker)
+            except asyncio.TimeoutError:
+                metrics.timeouts += 1
+                self.replace_worker(worker)
+                move = random.choice(game.state.legal_moves())
+            except Exception as e:  # e.g. bad agent options; the game can't go on
+                self.replace_worker(worker)
+                self.end(game, 'error')
+                raise RequestError("search failed: {!r}".format(e))
+            finally:
+                metrics.running -= 1
+                metrics.searches += 1
+        if game.result is None:  # the game may have been resigned in the meantime
+            self.play(game, move)
+
+    def play(self, game, col):
+        game.state = game.state.create_successor(col)
+        game.moves.append(col)
+        if game.state.is_full():
+            self.end(game, 'finished')
+
+    def wait_for_human(self, game):
+        """Start the clock on the human's next move."""
+        if game.result is None and self.human_timeout is not None:
+            game.deadline = asyncio.get_running_loop().time() + self.human_timeout
+
+    def end(self, game, result):
+        """Record a game's result and forget the game."""
+        if game.result is None:
+            game.result = result
+            if self.games.pop(game.id, None) is not None:
+                self.finished += 1  # games still being set up are counted by new_game()
+
+    async def expire_games(self, interval=1.0):
+        """Every interval seconds, end the games whose human has run out of time."""
+        while True:
+            await asyncio.sleep(interval)
+            now = asyncio.get_running_loop().time()
+            for game in list(self.games.values()):
+                if (game.deadline is not None and now > game.deadline
+                        and not game.lock.locked()):
+                    self.end(game, 'timeout')
+
+    async def respond(self, line, write):
+        """Handle one request line and write its response line."""
+        try:
+            request = json.loads(line)
+        except ValueError:
+            response = { 'error': "requests must be JSON" }
+        else:
+            response = await self.handle(request)
+        await write(json.dumps(response) + '\n')
+
+    async def serve_connection(self, reader, writer):
+        """Serve the requests of one socket client, handling each one as its own task."""
+        write_lock = asyncio.Lock()
+        tasks = set()
+
+        async def write(text):
+            async with write_lock:
+                writer.write(text.encode())
+                await writer.drain()
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                task = asyncio.ensure_future(self.respond(line.decode(), write))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+        writer.close()
+
+    async def serve_socket(self, host, port):
+        """Serve clients connecting to a TCP socket until cancelled."""
+        server = await asyncio.start_server(self.serve_connection, host, port)
+        print("Serving on {}:{}".format(host, port), file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    async def serve_stdin(self):
+        """Serve requests read from stdin, writing the responses to stdout, until end of input."""
+        loop = asyncio.get_running_loop()
+        tasks = set()
+
+        async def write(text):
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+        while True:
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                break
+            if line.strip():
+                task = asyncio.ensure_future(self.respond(line, write))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+
+
+async def main(args):
+    server = MatchServer(args.workers, args.move_timeout, args.human_timeout, args.max_games)
+    # stop cleanly on SIGTERM too, so the worker processes are shut down with the server
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    expiry = asyncio.ensure_future(server.expire_games())
+    try:
+        if args.stdin:
+            await server.serve_stdin()
+        else:
+            await server.serve_socket(args.host, args.port)
+    finally:
+        expiry.cancel()
+        server.close()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3830)
+    parser.add_argument('--stdin', action='store_true',
+                        help="read requests from stdin and answer on stdout instead of a socket")
+    parser.add_argument('--workers', type=int, help="number of search processes")
+    parser.add_argument('--move-timeout', type=float, metavar='SECONDS',
+                        help="play a random move if a computer search takes longer than this")
+    parser.add_argument('--human-timeout', type=float, metavar='SECONDS',
+                        help="end a game if the human takes longer than this to move")
+    parser.add_argument('--max-games', type=int, help="most games in progress at once")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
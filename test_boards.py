@@ -50,3 +50,6 @@ boards['test2'] = reversed([
 boards['your_test'] = reversed([])  # put something here!
 
 
+
+# reversed() gives one-shot iterators; keep the rows as lists so a board can be loaded repeatedly
+boards = { label: list(board) for label, board in boards.items() }
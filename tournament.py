@@ -0,0 +1,199 @@
+"""Headless Connect383 tournaments.
+
+Plays every pairing of the given agents against each other, on each starting position and at each
+depth, N games at a time, spread across a pool of worker processes.  Nothing is printed while the
+games run; instead one record per game is written to a JSON lines or CSV results file.
+
+    python tournament.py --agents p c r --sizes 4x5 6x7 --boards test_4x4 --depths 2 4 \\
+        --games 10 --workers 8 --out results.jsonl
+
+An agent spec is one of connect383's agent codes, optionally followed by constructor options,
+e.g. "p:ordering,tt=16" for an alpha-beta agent with move ordering and a 16MB transposition table.
+"""
+
+import argparse
+import ast
+import csv
+import itertools
+import json
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from connect383 import GameState, make_agent, load_test_board
+import test_boards
+
+
+FIELDS = [ 'game', 'p1', 'p2', 'start', 'depth', 'seed', 'score', 'winner', 'moves',
+           'p1_states', 'p2_states', 'move_ms' ]
+
+
+def parse_spec(spec):
+    """Split an agent spec such as "p:ordering,tt=16" into its code and options dict."""
+    code, _, opts = spec.partition(':')
+    options = {}
+    for opt in filter(None, opts.split(',')):
+        name, eq, value = opt.partition('=')
+        if not eq:
+            options[name] = True
+            continue
+        try:
+            options[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            options[name] = value
+    return code, options
+
+
+def start_state(start):
+    """Create the starting state for a start label: a size like "6x7" or a test_boards label."""
+    if start in test_boards.boards:
+        return load_test_board(start)
+    nrows, ncols = start.split('x')
+    return GameState(int(nrows), int(ncols))
+
+
+def run_game(player1, player2, state, depth=None):
+    """Play one game to the end without printing anything.
+
+    Returns: a dict with the final score, the winner (1, 2, or 0 for a tie), the list of moves,
+        the number of states each player generated and each move's wall time in milliseconds
+    """
+    moves = []
+    move_ms = []
+    state_counts = { 1: 0, -1: 0 }
+    counter = type(state)
+    while not state.is_full():
+        nextp = state.next_player()
+        player = player1 if nextp == 1 else player2
+        count_prev = counter.state_count
+        start = time.perf_counter()
+        move, state = player.get_move(state, depth)
+        move_ms.append(round((time.perf_counter() - start) * 1000, 3))
+        state_counts[nextp] += counter.state_count - count_prev
+        moves.append(move)
+
+    score = state.score()
+    return { 'score': score,
+             'winner': 1 if score > 0 else 2 if score < 0 else 0,
+             'moves': moves,
+             'p1_states': state_counts[1],
+             'p2_states': state_counts[-1],
+             'move_ms': move_ms }
+
+
+def play_match(job):
+    """Play the game described by a job dict (see make_jobs()) and return its record."""
+    random.seed(job['seed'])
+    players = []
+    for spec in (job['p1'], job['p2']):
+        code, options = parse_spec(spec)
+        players.append(make_agent(code, depth=job['depth'], **options))
+    try:
+        record = run_game(players[0], players[1], start_state(job['start']), job['depth'])
+    finally:
+        for player in players:
+            if hasattr(player, 'close'):
+                player.close()
+    return dict(job, **record)
+
+
+def make_jobs(specs, starts, depths, games, seed=0):
+    """List one job per game: every ordered pairing of specs, start and depth, games times each.
+
+    A single spec plays against itself.
+    """
+    if len(specs) == 1:
+        pairings = [ (specs[0], specs[0]) ]
+    else:
+        pairings = list(itertools.permutations(specs, 2))
+    jobs = []
+    for (p1, p2), start, depth in itertools.product(pairings, starts, depths):
+        for _ in range(games):
+            jobs.append({ 'game': len(jobs), 'p1': p1, 'p2': p2, 'start': start,
+                          'depth': depth, 'seed': seed + len(jobs) })
+    return jobs
+
+
+def run_tournament(jobs, workers=None):
+    """Play all the jobs in a process pool, yielding each game's record in job order."""
+    if workers == 1:
+        yield from map(play_match, jobs)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        yield from pool.map(play_match, jobs)
+
+
+class ResultsWriter:
+    """Writes game records to a JSON lines or CSV file, one line per game."""
+
+    def __init__(self, f, fmt):
+        self.f = f
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.csv = csv.DictWriter(f, FIELDS, extrasaction='ignore')
+            self.csv.writeheader()
+
+    def write(self, record):
+        if self.fmt == 'csv':
+            row = dict(record)
+            row['moves'] = ' '.join(str(m) for m in record['moves'])
+            row['move_ms'] = ' '.join(str(t) for t in record['move_ms'])
+            row['depth'] = '' if record['depth'] is None else record['depth']
+            self.csv.writerow(row)
+        else:
+            self.f.write(json.dumps(record) + '\n')
+
+
+def summarize(records):
+    """Return a text table of wins, losses and ties for each pairing, from Player 1's side."""
+    totals = {}
+    for record in records:
+        key = (record['p1'], record['p2'], record['start'], record['depth'])
+        counts = totals.setdefault(key, [0, 0, 0])
+        counts[{ 1: 0, 2: 1, 0: 2 }[record['winner']]] += 1  # wins, losses, ties
+    lines = [ "{:<16}{:<16}{:<16}{:>6}{:>8}{:>8}{:>8}".format(
+        "player 1", "player 2", "start", "depth", "wins", "losses", "ties") ]
+    for (p1, p2, start, depth), (wins, losses, ties) in totals.items():
+        lines.append("{:<16}{:<16}{:<16}{:>6}{:>8}{:>8}{:>8}".format(
+            p1, p2, start, str(depth), wins, losses, ties))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agents', nargs='+', required=True, metavar='SPEC',
+                        help="agent specs, e.g. p, c, r or p:ordering,tt=16")
+    parser.add_argument('--sizes', nargs='*', default=[], metavar='ROWSxCOLS',
+                        help="empty boards to start from, e.g. 6x7")
+    parser.add_argument('--boards', nargs='*', default=[], choices=test_boards.boards.keys(),
+                        help="test_boards positions to start from")
+    parser.add_argument('--depths', nargs='+', default=['2'],
+                        help="depth limits to play at ('none' for unlimited)")
+    parser.add_argument('--games', type=int, default=1, help="games per pairing")
+    parser.add_argument('--workers', type=int, help="number of worker processes")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the first game")
+    parser.add_argument('--out', default='results.jsonl', help="results file")
+    parser.add_argument('--format', choices=['jsonl', 'csv'],
+                        help="results format (default: from the file extension)")
+    args = parser.parse_args()
+
+    for spec in args.agents:
+        if parse_spec(spec)[0] == 'h':
+            parser.error("human agents can't play in a headless tournament")
+    depths = [ None if d.lower() == 'none' else int(d) for d in args.depths ]
+    starts = args.sizes + args.boards or ['6x7']
+    fmt = args.format or ('csv' if args.out.endswith('.csv') else 'jsonl')
+
+    jobs = make_jobs(args.agents, starts, depths, args.games, args.seed)
+    records = []
+    with open(args.out, 'w', newline='') as f:
+        writer = ResultsWriter(f, fmt)
+        for record in run_tournament(jobs, args.workers):
+            writer.write(record)
+            records.append(record)
+            print("\r{}/{} games".format(len(records), len(jobs)), end='', file=sys.stderr)
+    print(file=sys.stderr)
+    print(summarize(records))
+    print("Results written to", args.out)
@@ -0,0 +1,106 @@
+"""Transposition table for the minimax agents.
+
+Different move orders often reach the same board.  The table remembers the result of searching a
+position, indexed by the position's Zobrist hash (see connect383.GameState.zobrist_hash()), so a
+later search that reaches the same board can reuse it instead of searching it again.
+"""
+
+import math
+from collections import namedtuple
+
+
+FULL_DEPTH = math.inf  # depth recorded for values from an unlimited (depth=None) search
+
+# Bound types: whether a stored value is the exact minimax value, or only a bound on it
+EXACT = 0
+LOWER = 1  # the true value is >= the stored value
+UPPER = 2  # the true value is <= the stored value
+
+ENTRY_BYTES = 200  # rough memory cost of one stored entry, used to size tables by megabytes
+
+Entry = namedtuple('Entry', ['key', 'value', 'depth', 'bound', 'move', 'age'])
+
+
+def search_depth(depth):
+    """Convert an agent's depth argument (None meaning unlimited) to a comparable number."""
+    return FULL_DEPTH if depth is None else depth
+
+
+class TranspositionTable:
+    """Fixed-size table of search results with depth-preferred replacement.
+
+    Each position hashes to a single slot.  When two positions compete for a slot, the new result
+    replaces the old one if it is for the same position, if the old one is left over from an
+    earlier move's search, or if it was searched at least as deeply; otherwise the old one is kept.
+    """
+
+    def __init__(self, max_entries=2**20):
+        """Constructor for an empty table.
+
+        Args:
+            max_entries: number of slots in the table, which caps its memory use
+        """
+        self.size = max_entries
+        self.slots = [None] * max_entries
+        self.age = 0  # bumped for each new root search, so stale entries can be replaced
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    @classmethod
+    def from_megabytes(cls, megabytes):
+        """Create a table sized to use roughly the given amount of memory."""
+        return cls(max(1, int(megabytes * 2**20 / ENTRY_BYTES)))
+
+    def new_search(self):
+        """Mark the start of a new root search."""
+        self.age += 1
+
+    def probe(self, key, depth):
+        """Look up a stored result for a position.
+
+        Args:
+            key: the position's Zobrist hash
+            depth: the depth the caller is about to search to (None for unlimited)
+
+        Returns: the stored Entry if it is for this position and was searched at least as deeply,
+            otherwise None
+        """
+        entry = self.slots[key % self.size]
+        if entry is not None and entry.key == key and entry.depth >= search_depth(depth):
+            self.hits += 1
+            return entry
+        if entry is not None and entry.key != key:
+            self.collisions += 1
+        self.misses += 1
+        return None
+
+    def best_move(self, key):
+        """Return the best move stored for a position at any depth, or None (not counted)."""
+        entry = self.slots[key % self.size]
+        if entry is not None and entry.key == key:
+            return entry.move
+        return None
+
+    def store(self, key, value, depth, bound=EXACT, move=None):
+        """Record the result of searching a position.
+
+        Args:
+            key: the position's Zobrist hash
+            value: the value found by the search
+            depth: the depth searched to (None for unlimited)
+            bound: EXACT, LOWER or UPPER
+            move: the best move found, if any
+        """
+        index = key % self.size
+        depth = search_depth(depth)
+        old = self.slots[index]
+        if old is None or old.key == key or old.age != self.age or depth >= old.depth:
+            self.slots[index] = Entry(key, value, depth, bound, move, self.age)
+
+    def __len__(self):
+        return sum(1 for entry in self.slots if entry is not None)
+
+    def stats(self):
+        """Summarize the table's counters as a string."""
+        return "{} hits, {} misses, {} collisions".format(self.hits, self.misses, self.collisions)
@@ -0,0 +1,203 @@
+"""Self-play tuning of the evaluation's weights (see patterns.py).
+
+Both evaluations are linear in their weights: the pattern evaluation is the score so far plus a
+weighted count of open windows, and the streak evaluation (HeuristicAgent.evaluation() without
+patterns) a weighted sum of three terms over the streaks of the board.  Each round, agents using
+the current weights play games against themselves, N at a time across a pool of worker
+processes, with a few random moves at the start and along the way so the games differ.  Every
+position reached is then paired with the final score() of its game, less the position's score for
+the pattern evaluation (which adds the score itself), and the weights are fitted to it by (ridge)
+least squares: the tuned evaluation estimates the final score of a game.  After the last round
+the tuned weights play a match against the starting ones, and are written to a weights file that
+agents load with --weights.
+
+    python tuning.py --size 6x7 --depth 2 --games 200 --rounds 3 --workers 8 --out weights.json
+    python tuning.py --evaluation streaks --start weights.json --out weights.json
+    python connect383.py p c 6 7 --depth 4 --weights weights.json
+
+Fitting needs NumPy.
+"""
+
+import argparse
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from agents import PruneAgent
+from connect383 import GameState
+import patterns
+import vectorized
+
+np = vectorized.np
+
+
+def play_job(job):
+    """Play the game described by a job dict (see make_jobs()) and return its record.
+
+    Returns: a dict with the moves played and the final score
+    """
+    rng = random.Random(job['seed'])
+    agents = [ make_player(job['evaluation'], weights) for weights in (job['p1'], job['p2']) ]
+    state = GameState(job['nrows'], job['ncols'])
+    moves = []
+    while not state.is_full():
+        if len(moves) < job['random_plies'] or rng.random() < job['epsilon']:
+            move, state = rng.choice(state.successors())
+        else:
+            agent = agents[0] if state.next_player() == 1 else agents[1]
+            move, state = agent.get_move(state, job['depth'])
+        moves.append(move)
+    return { 'moves': moves, 'score': state.score() }
+
+
+def make_player(evaluation, weights):
+    """Create a self-play agent using the 'patterns' or 'streaks' evaluation with the weights."""
+    if evaluation == 'patterns':
+        return PruneAgent(ordering=True, use_patterns=True, weights=weights)
+    return PruneAgent(ordering=True, streak_weights=weights)
+
+
+def make_jobs(nrows, ncols, depth, p1, p2, games, seed=0, random_plies=2, epsilon=0.0,
+              evaluation='patterns'):
+    """List one job per game between weights p1 and p2, each with its own seed."""
+    return [ { 'nrows': nrows, 'ncols': ncols, 'depth': depth, 'p1': p1, 'p2': p2,
+               'seed': seed + g, 'random_plies': random_plies, 'epsilon': epsilon,
+               'evaluation': evaluation }
+             for g in range(games) ]
+
+
+def run_jobs(jobs, workers=None):
+    """Play all the jobs in a process pool, returning each game's record in job order."""
+    if workers == 1:
+        return list(map(play_job, jobs))
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(play_job, jobs, chunksize=max(1, len(jobs) // 64)))
+
+
+def game_positions(nrows, ncols, moves, skip=0):
+    """Replay a game's moves, returning the states before each move from the skip'th on."""
+    state = GameState(nrows, ncols)
+    states = []
+    for i, move in enumerate(moves):
+        if i >= skip:
+            states.append(state)
+        state = state.create_successor(move)
+    return states
+
+
+def features(boards, nrows, ncols, evaluation='patterns'):
+    """Count the terms of each weight's kind on a stack of boards, Player 1's minus Player 2's.
+
+    For the streak evaluation these are vectorized.BatchEvaluator.streak_features().  For the
+    pattern evaluation they are the windows of each kind: the pattern value of a board is the
+    dot product of its row with the weights, which is how these counts are found, each column
+    being the value with that weight 1 and the others 0.
+
+    Returns: an (n, number of weights) array
+    """
+    batch = vectorized.get_evaluator(nrows, ncols)
+    if evaluation == 'streaks':
+        return batch.streak_features(boards)
+    columns = []
+    for k in range(len(patterns.WEIGHT_NAMES)):
+        unit = tuple(int(j == k) for j in range(len(patterns.WEIGHT_NAMES)))
+        columns.append(batch.pattern_values(boards, patterns.get_evaluator(nrows, ncols, unit)))
+    return np.stack(columns, axis=1)
+
+
+def fit_weights(X, y, ridge=1.0):
+    """Solve for the weights w minimizing |X w - y|^2 + ridge |w|^2."""
+    A = X.T @ X + ridge * np.eye(X.shape[1])
+    return np.linalg.solve(A, X.T @ y)
+
+
+def training_data(records, nrows, ncols, skip, evaluation='patterns'):
+    """Turn self-play records into a feature matrix and the value to fit for each position.
+
+    The value is the game's final score, less the position's score for the pattern evaluation.
+    """
+    states = []
+    final = []
+    for record in records:
+        game = game_positions(nrows, ncols, record['moves'], skip)
+        states.extend(game)
+        final.extend([record['score']] * len(game))
+    boards = vectorized.stack_boards(states)
+    target = np.array(final)
+    if evaluation == 'patterns':
+        target = target - vectorized.get_evaluator(nrows, ncols).score(boards)
+    return features(boards, nrows, ncols, evaluation), target
+
+
+def match(nrows, ncols, depth, weights, baseline, games, seed, workers, evaluation='patterns'):
+    """Play weights against baseline, each game once from each side.
+
+    Returns: (wins, losses, ties, average margin), from the weights' side
+    """
+    jobs = (make_jobs(nrows, ncols, depth, weights, baseline, games, seed, evaluation=evaluation)
+            + make_jobs(nrows, ncols, depth, baseline, weights, games, seed,
+                        evaluation=evaluation))
+    margins = [ record['score'] * (1 if i < games else -1)
+                for i, record in enumerate(run_jobs(jobs, workers)) ]
+    return (sum(1 for m in margins if m > 0), sum(1 for m in margins if m < 0),
+            sum(1 for m in margins if m == 0), sum(margins) / len(margins))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', default='6x7', metavar='ROWSxCOLS')
+    parser.add_argument('--evaluation', choices=['patterns', 'streaks'], default='patterns',
+                        help="which evaluation's weights to tune")
+    parser.add_argument('--depth', type=int, default=2, help="search depth of the self-play agents")
+    parser.add_argument('--games', type=int, default=100, help="self-play games per round")
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--random-plies', type=int, default=4,
+                        help="random moves at the start of each self-play game")
+    parser.add_argument('--epsilon', type=float, default=0.1,
+                        help="chance of a random move later in a self-play game")
+    parser.add_argument('--ridge', type=float, default=1.0, help="ridge regularization strength")
+    parser.add_argument('--match-games', type=int, default=50,
+                        help="games per side in the final match against the starting weights")
+    parser.add_argument('--start', metavar='FILE',
+                        help="weights file to start from; its other set of weights is kept")
+    parser.add_argument('--workers', type=int, help="number of worker processes")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='weights.json', help="weights file to write")
+    args = parser.parse_args()
+
+    if np is None:
+        parser.error("tuning needs NumPy")
+    nrows, ncols = (int(n) for n in args.size.split('x'))
+    # the sets of weights to write out: the tuned one, and any other the start file has
+    tuned = dict(zip(['patterns', 'streaks'],
+                     patterns.load_weights(args.start) if args.start else (None, None)))
+    start = tuned[args.evaluation]
+    if start is None:
+        start = (patterns.DEFAULT_WEIGHTS if args.evaluation == 'patterns'
+                 else patterns.DEFAULT_STREAK_WEIGHTS)
+    weights = start
+    seed = args.seed
+    for r in range(args.rounds):
+        began = time.perf_counter()
+        jobs = make_jobs(nrows, ncols, args.depth, weights, weights, args.games, seed,
+                         args.random_plies, args.epsilon, args.evaluation)
+        seed += args.games
+        X, y = training_data(run_jobs(jobs, args.workers), nrows, ncols, args.random_plies,
+                             args.evaluation)
+        fitted = fit_weights(X, y, args.ridge)
+        weights = tuple(int(round(w)) for w in fitted)
+        error = np.sqrt(np.mean((X @ np.array(weights) - y) ** 2))
+        print("round {}: {} positions, weights {}, rms error {:.2f} points ({:.1f}s)".format(
+            r + 1, len(y), weights, error, time.perf_counter() - began))
+
+    wins, losses, ties, margin = match(nrows, ncols, args.depth, weights, start,
+                                       args.match_games, seed, args.workers, args.evaluation)
+    print("tuned vs starting weights at depth {}: {} wins, {} losses, {} ties, "
+          "average margin {:+.1f}".format(args.depth, wins, losses, ties, margin))
+    tuned[args.evaluation] = weights
+    patterns.save_weights(args.out, tuned['patterns'], tuned['streaks'], size=args.size,
+                          depth=args.depth, evaluation=args.evaluation,
+                          games=args.games * args.rounds, start=list(start),
+                          match=[wins, losses, ties, margin])
+    print("Weights written to", args.out)
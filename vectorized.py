@@ -0,0 +1,158 @@
+"""Vectorized scoring and evaluation of many boards at once, using NumPy.
+
+BatchEvaluator computes the same values as GameState.score() and HeuristicAgent.evaluation()
+(with or without pattern evaluation), but for a whole stack of boards in a handful of array
+operations instead of Python loops over every line of every board.  NumPy is optional: the rest
+of the game runs without it, and only code that asks for a BatchEvaluator needs it installed.
+"""
+
+from geometry import get_geometry
+from patterns import DEFAULT_STREAK_WEIGHTS
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, see above
+    np = None
+
+
+PAD = 2  # value of the padding cell used to make every line the same length
+
+_evaluators = {}  # (nrows, ncols) -> BatchEvaluator
+
+
+def line_indices(nrows, ncols):
+    """Return the flat board indices (r * ncols + c) of every line on a board.
+
+    The lines come in the same order, and with the same contents, as
+    GameState.get_all_rows() + get_all_cols() + get_all_diags().
+    """
+    return get_geometry(nrows, ncols).indices
+
+
+def get_evaluator(nrows, ncols):
+    """Return the (shared) BatchEvaluator for a board size."""
+    evaluator = _evaluators.get((nrows, ncols))
+    if evaluator is None:
+        evaluator = _evaluators[(nrows, ncols)] = BatchEvaluator(nrows, ncols)
+    return evaluator
+
+
+def stack_boards(states):
+    """Stack the boards of several same-sized states into one (n, nrows, ncols) array."""
+    return np.array([ state.board for state in states ], dtype=np.int8)
+
+
+class BatchEvaluator:
+    """Scores and evaluates stacks of boards of one size.
+
+    Every line of the board is gathered into a (lines x longest line) array using precomputed
+    indices, with shorter lines padded with PAD.  Streaks are then found for all lines of all
+    boards at once: a streak ends wherever a cell differs from the next one, and its length is
+    the distance back to where it started.
+    """
+
+    def __init__(self, nrows, ncols):
+        if np is None:
+            raise ImportError("BatchEvaluator requires NumPy")
+        self.num_rows = nrows
+        self.num_cols = ncols
+        lines = line_indices(nrows, ncols)
+        width = max(len(line) for line in lines)
+        pad_index = nrows * ncols  # boards get one extra cell holding PAD
+        self.index = np.full((len(lines), width), pad_index, dtype=np.intp)
+        for i, line in enumerate(lines):
+            self.index[i, :len(line)] = line
+        self.positions = np.arange(width)
+        self.windows = None  # see window_index()
+
+    def streaks(self, boards):
+        """Find the streaks in every line of every board.
+
+        Args:
+            boards: array of shape (n, nrows, ncols) holding 1, -1 and 0
+
+        Returns: (cells, ends, lengths, following) arrays of shape (n, lines, width):
+            the line contents, whether each cell ends a streak, the length of the streak up to
+            each cell, and the value of the cell after each one (PAD past the end of a line)
+        """
+        n = boards.shape[0]
+        flat = np.empty((n, self.num_rows * self.num_cols + 1), dtype=np.int8)
+        flat[:, :-1] = boards.reshape(n, -1)
+        flat[:, -1] = PAD
+        cells = flat[:, self.index]
+
+        starts = np.ones(cells.shape, dtype=bool)
+        starts[..., 1:] = cells[..., 1:] != cells[..., :-1]
+        ends = np.ones(cells.shape, dtype=bool)
+        ends[..., :-1] = starts[..., 1:]
+        start_pos = np.maximum.accumulate(np.where(starts, self.positions, 0), axis=-1)
+        lengths = self.positions - start_pos + 1
+
+        following = np.full(cells.shape, PAD, dtype=np.int8)
+        following[..., :-1] = cells[..., 1:]
+        return cells, ends, lengths, following
+
+    def score(self, boards):
+        """Vectorized GameState.score(): an array with one score per board."""
+        cells, ends, lengths, _ = self.streaks(boards)
+        players = np.where((cells == 1) | (cells == -1), cells, 0).astype(np.int64)
+        points = np.where(ends & (lengths >= 3), lengths ** 2, 0)
+        return (players * points).sum(axis=(1, 2))
+
+    def evaluate(self, boards, streak_weights=DEFAULT_STREAK_WEIGHTS):
+        """Vectorized HeuristicAgent.evaluation(): an array with one estimate per board.
+
+        With the default weights, each streak is worth length**2 if it is 3 or longer, 5 if it is
+        a pair, plus 5 per piece if the cell after it is empty.
+        """
+        return self.streak_features(boards) @ np.array(streak_weights)
+
+    def streak_features(self, boards):
+        """Total the streak evaluation's terms on each board, Player 1's minus Player 2's.
+
+        The evaluation of a board is the dot product of its row with the streak weights (see
+        patterns.STREAK_WEIGHT_NAMES).
+
+        Returns: an (n, 3) array of the number of pairs, the pieces of streaks followed by an
+            empty cell and the sum of length**2 over streaks of 3 or more
+        """
+        cells, ends, lengths, following = self.streaks(boards)
+        players = np.where((cells == 1) | (cells == -1), cells, 0).astype(np.int64)
+        players = np.where(ends, players, 0)
+        terms = [ lengths == 2,
+                  np.where(following == 0, lengths, 0),
+                  np.where(lengths >= 3, lengths ** 2, 0) ]
+        return np.stack([ (players * term).sum(axis=(1, 2)) for term in terms ], axis=1)
+
+    def evaluate_patterns(self, boards, pattern_evaluator):
+        """Vectorized pattern evaluation (see HeuristicAgent.evaluation()): an array with the
+        score plus the pattern value of each board."""
+        return self.score(boards) + self.pattern_values(boards, pattern_evaluator)
+
+    def pattern_values(self, boards, pattern_evaluator):
+        """Vectorized patterns.PatternEvaluator.value(): an array with one value per board.
+
+        The windows of each length are gathered into a (n, windows, length) array, and their
+        base-3 codes are computed with one matrix product and looked up in the table.
+        """
+        n = boards.shape[0]
+        digits = (boards.reshape(n, -1) % 3).astype(np.int64)  # Player 2's -1 becomes 2
+        table = np.array(pattern_evaluator.table, dtype=np.int64)
+        total = np.zeros(n, dtype=np.int64)
+        for base, index in self.window_index(pattern_evaluator):
+            powers = 3 ** np.arange(index.shape[1])
+            total += table[base + digits[:, index] @ powers].sum(axis=1)
+        return total
+
+    def window_index(self, pattern_evaluator):
+        """Group a PatternEvaluator's windows by length, as (table base, index array) pairs.
+
+        The windows only depend on the board size, so they are grouped once and kept.
+        """
+        if self.windows is None:
+            groups = {}
+            for base, indices in pattern_evaluator.windows:
+                groups.setdefault(base, []).append(indices)
+            self.windows = [ (base, np.array(windows, dtype=np.intp))
+                             for base, windows in groups.items() ]
+        return self.windows